@@ -4,16 +4,35 @@ from sqlalchemy import text
 import db
 
 
+def _date_str(value):
+    """sale_date идва като str (SQLite) или date (Postgres) – уеднаквяваме до 'YYYY-MM-DD'."""
+    return None if value is None else str(value)[:10]
+
+
+def get_data_version() -> str:
+    """
+    Евтин токен за версията на данните: броячът app_meta.data_version.
+    Вдига се в същата транзакция като новите продажби и промените в
+    цените/rollup-ите, затова е подходящ за ключ на кеша в dashboard-а.
+    """
+    engine = db.get_sqlalchemy_engine()
+    with engine.connect() as conn:
+        meta_version = conn.execute(
+            text("SELECT value FROM app_meta WHERE key = 'data_version'")
+        ).scalar()
+    return str(meta_version or 0)
+
+
 def get_vendors_list():
     """
-    Връща списък с vendor-и, взети от таблицата sales и product_prices,
-    за да покажем само тези, за които има данни.
+    Връща списък с vendor-и, взети от daily_vendor_revenue (rollup-а на sales)
+    и product_prices, за да покажем само тези, за които има данни.
     """
     engine = db.get_sqlalchemy_engine()
 
     query = """
         SELECT DISTINCT vendor_id FROM (
-            SELECT vendor_id FROM sales
+            SELECT vendor_id FROM daily_vendor_revenue
             UNION
             SELECT vendor_id FROM product_prices
         ) t
@@ -32,15 +51,15 @@ def get_daily_revenue_df(vendor_id: int):
     query = text(
         """
         SELECT
-            substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2) AS date,
-            SUM(revenue) AS total_revenue
-        FROM sales
+            sale_date AS date,
+            revenue AS total_revenue
+        FROM daily_vendor_revenue
         WHERE vendor_id = :vendor_id
-        GROUP BY date
-        ORDER BY date;
+        ORDER BY sale_date;
         """
     )
     df = pd.read_sql_query(query, engine, params={"vendor_id": vendor_id})
+    df["date"] = df["date"].map(_date_str)
     return df
 
 
@@ -56,9 +75,9 @@ def get_product_revenue_for_date(vendor_id: int, date_str: str):
             product_name,
             SUM(quantity) AS quantity,
             SUM(revenue) AS revenue
-        FROM sales
+        FROM daily_product_revenue
         WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2)) = :date_str
+          AND sale_date = :date_str
         GROUP BY product_name
         ORDER BY revenue DESC;
         """
@@ -82,16 +101,29 @@ def get_vendor_date_bounds(vendor_id: int):
     query = text(
         """
         SELECT
-            MIN(substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2)) AS min_date,
-            MAX(substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2)) AS max_date
-        FROM sales
+            MIN(sale_date) AS min_date,
+            MAX(sale_date) AS max_date
+        FROM daily_vendor_revenue
         WHERE vendor_id = :vendor_id;
         """
     )
     df = pd.read_sql_query(query, engine, params={"vendor_id": vendor_id})
     if df.empty or df["min_date"].iloc[0] is None:
         return None, None
-    return df["min_date"].iloc[0], df["max_date"].iloc[0]
+    return _date_str(df["min_date"].iloc[0]), _date_str(df["max_date"].iloc[0])
+
+
+def _period_stats(daily_df):
+    """(total_revenue, total_qty, avg_per_day) от дневни редове с total_revenue и quantity."""
+    if daily_df.empty:
+        return 0.0, 0, 0.0
+    total_revenue = float(daily_df["total_revenue"].sum())
+    total_qty = int(daily_df["quantity"].sum())
+
+    # Среден оборот на ден
+    num_days = daily_df["date"].nunique()
+    avg_per_day = total_revenue / num_days if num_days > 0 else 0.0
+    return total_revenue, total_qty, avg_per_day
 
 
 def get_vendor_stats_for_period(vendor_id: int, date_from: str, date_to: str):
@@ -104,18 +136,17 @@ def get_vendor_stats_for_period(vendor_id: int, date_from: str, date_to: str):
     """
     engine = db.get_sqlalchemy_engine()
 
-    # Дневна агрегация
+    # Дневна агрегация – оборот и бройки с едно минаване
     query_daily = text(
         """
         SELECT
-            substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2) AS date,
-            SUM(revenue) AS total_revenue
-        FROM sales
+            sale_date AS date,
+            revenue AS total_revenue,
+            quantity
+        FROM daily_vendor_revenue
         WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2))
-              BETWEEN :date_from AND :date_to
-        GROUP BY date
-        ORDER BY date;
+          AND sale_date BETWEEN :date_from AND :date_to
+        ORDER BY sale_date;
         """
     )
     daily_df = pd.read_sql_query(
@@ -125,36 +156,12 @@ def get_vendor_stats_for_period(vendor_id: int, date_from: str, date_to: str):
     )
 
     if daily_df.empty:
-        return daily_df, 0.0, 0, 0.0
-
-    total_revenue = float(daily_df["total_revenue"].sum())
+        return daily_df[["date", "total_revenue"]], 0.0, 0, 0.0
 
-    # Общо количество за периода
-    query_qty = text(
-        """
-        SELECT SUM(quantity) AS total_qty
-        FROM sales
-        WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2))
-              BETWEEN :date_from AND :date_to;
-        """
-    )
-    qty_df = pd.read_sql_query(
-        query_qty,
-        engine,
-        params={"vendor_id": vendor_id, "date_from": date_from, "date_to": date_to},
-    )
-    total_qty = (
-        int(qty_df["total_qty"].iloc[0])
-        if not qty_df.empty and qty_df["total_qty"].iloc[0] is not None
-        else 0
-    )
-
-    # Среден оборот на ден
-    num_days = daily_df["date"].nunique()
-    avg_per_day = total_revenue / num_days if num_days > 0 else 0.0
+    daily_df["date"] = daily_df["date"].map(_date_str)
+    total_revenue, total_qty, avg_per_day = _period_stats(daily_df)
 
-    return daily_df, total_revenue, total_qty, avg_per_day
+    return daily_df[["date", "total_revenue"]], total_revenue, total_qty, avg_per_day
 
 
 def get_top_products_for_period(vendor_id: int, date_from: str, date_to: str, limit: int = 20):
@@ -169,10 +176,9 @@ def get_top_products_for_period(vendor_id: int, date_from: str, date_to: str, li
             product_name,
             SUM(quantity) AS total_qty,
             SUM(revenue) AS total_revenue
-        FROM sales
+        FROM daily_product_revenue
         WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2))
-              BETWEEN :date_from AND :date_to
+          AND sale_date BETWEEN :date_from AND :date_to
         GROUP BY product_name
         ORDER BY total_revenue DESC
         LIMIT {limit};
@@ -197,9 +203,8 @@ def get_all_vendors_revenue_for_period(date_from: str, date_to: str):
         SELECT
             vendor_id,
             SUM(revenue) AS total_revenue
-        FROM sales
-        WHERE (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2))
-              BETWEEN :date_from AND :date_to
+        FROM daily_vendor_revenue
+        WHERE sale_date BETWEEN :date_from AND :date_to
         GROUP BY vendor_id
         ORDER BY total_revenue DESC;
         """
@@ -210,3 +215,90 @@ def get_all_vendors_revenue_for_period(date_from: str, date_to: str):
         params={"date_from": date_from, "date_to": date_to},
     )
     return df
+
+
+# ====== ВСИЧКО ЗА ЕДИН ИЗГЛЕД НА DASHBOARD-А ======
+
+def get_dashboard_snapshot(vendor_id: int, date_from: str, date_to: str, top_limit: int = 20):
+    """
+    Връща всичко, което dashboard-ът показва за (vendor, период), с една заявка
+    (UNION ALL върху rollup таблиците), разделена после в pandas:
+    - daily_df: дневен оборот на vendor-а за периода (date, total_revenue)
+    - total_revenue, total_qty, avg_per_day: като get_vendor_stats_for_period
+    - available_dates: всички дати с продажби за vendor-а ('YYYY-MM-DD', сортирани)
+    - top_df: TOP продукти за периода (product_name, total_qty, total_revenue)
+    - all_vendors_df: оборот по vendor за периода (vendor_id, total_revenue)
+    """
+    engine = db.get_sqlalchemy_engine()
+    query = text(
+        """
+        SELECT 'period' AS part, vendor_id, CAST(NULL AS TEXT) AS product_name,
+               sale_date, quantity, revenue
+        FROM daily_vendor_revenue
+        WHERE sale_date BETWEEN :date_from AND :date_to
+
+        UNION ALL
+
+        SELECT 'date' AS part, vendor_id, NULL, sale_date, NULL, NULL
+        FROM daily_vendor_revenue
+        WHERE vendor_id = :vendor_id
+          AND (sale_date < :date_from OR sale_date > :date_to)
+
+        UNION ALL
+
+        SELECT 'product' AS part, vendor_id, product_name, NULL, SUM(quantity), SUM(revenue)
+        FROM daily_product_revenue
+        WHERE vendor_id = :vendor_id
+          AND sale_date BETWEEN :date_from AND :date_to
+        GROUP BY vendor_id, product_name;
+        """
+    )
+    df = pd.read_sql_query(
+        query,
+        engine,
+        params={"vendor_id": vendor_id, "date_from": date_from, "date_to": date_to},
+    )
+    df["sale_date"] = df["sale_date"].map(_date_str)
+
+    period = df[df["part"] == "period"]
+
+    # Дневна серия за избрания vendor
+    daily_df = (
+        period[period["vendor_id"] == vendor_id]
+        .rename(columns={"sale_date": "date", "revenue": "total_revenue"})
+        .sort_values("date")
+        [["date", "total_revenue", "quantity"]]
+        .reset_index(drop=True)
+    )
+    total_revenue, total_qty, avg_per_day = _period_stats(daily_df)
+
+    # Всички дати с продажби (в периода + извън него)
+    dates = df[df["part"] == "date"]["sale_date"].tolist() + daily_df["date"].tolist()
+    available_dates = sorted(set(dates))
+
+    top_df = (
+        df[df["part"] == "product"]
+        .rename(columns={"quantity": "total_qty", "revenue": "total_revenue"})
+        .sort_values("total_revenue", ascending=False)
+        .head(top_limit)
+        [["product_name", "total_qty", "total_revenue"]]
+        .reset_index(drop=True)
+    )
+    top_df["total_qty"] = top_df["total_qty"].astype(int)
+
+    all_vendors_df = (
+        period.groupby("vendor_id", as_index=False)["revenue"].sum()
+        .rename(columns={"revenue": "total_revenue"})
+        .sort_values("total_revenue", ascending=False)
+        .reset_index(drop=True)
+    )
+
+    return {
+        "daily_df": daily_df[["date", "total_revenue"]],
+        "total_revenue": total_revenue,
+        "total_qty": total_qty,
+        "avg_per_day": avg_per_day,
+        "available_dates": available_dates,
+        "top_df": top_df,
+        "all_vendors_df": all_vendors_df,
+    }
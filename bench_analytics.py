@@ -0,0 +1,126 @@
+"""
+Бенчмарк на заявките от analytics.py и report.py върху растяща история.
+
+За всеки размер от --sizes историята се удължава (с постоянна гъстота
+--rows-per-day) с gen_sales_history и всяка функция се мери --repeat пъти
+(медиана, в ms). Накрая се записва сравнителен отчет (Markdown + CSV).
+
+    python bench_analytics.py --sizes 100000,300000,1000000
+    python bench_analytics.py --database-url postgresql://localhost/bench --force
+
+По подразбиране се ползва нов SQLite файл във временна папка.
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def _time_call(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _cases(analytics, report, vendor_id: int, last_day: str, period_from: str):
+    """(име, функция) за всичко, което dashboard-ът и report.py ползват."""
+    return [
+        ("get_data_version", lambda: analytics.get_data_version()),
+        ("get_vendors_list", lambda: analytics.get_vendors_list()),
+        ("get_vendor_date_bounds", lambda: analytics.get_vendor_date_bounds(vendor_id)),
+        ("get_daily_revenue_df", lambda: analytics.get_daily_revenue_df(vendor_id)),
+        ("get_product_revenue_for_date", lambda: analytics.get_product_revenue_for_date(vendor_id, last_day)),
+        ("get_vendor_stats_for_period", lambda: analytics.get_vendor_stats_for_period(vendor_id, period_from, last_day)),
+        ("get_top_products_for_period", lambda: analytics.get_top_products_for_period(vendor_id, period_from, last_day)),
+        ("get_all_vendors_revenue_for_period", lambda: analytics.get_all_vendors_revenue_for_period(period_from, last_day)),
+        ("get_dashboard_snapshot", lambda: analytics.get_dashboard_snapshot(vendor_id, period_from, last_day)),
+        ("report.get_daily_revenue", lambda: report.get_daily_revenue(vendor_id, last_day)),
+    ]
+
+
+def write_report(results, sizes, path_md: str, path_csv: str, dialect: str):
+    names = list(results)
+    with open(path_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["function"] + [str(s) for s in sizes])
+        for name in names:
+            writer.writerow([name] + [f"{results[name][s]:.2f}" for s in sizes])
+
+    lines = [
+        f"# Analytics benchmark ({dialect}, {datetime.now():%Y-%m-%d %H:%M})",
+        "",
+        "Медиана в ms; колоните са брой редове в sales.",
+        "",
+        "| function | " + " | ".join(f"{s:,}" for s in sizes) + " |",
+        "|---|" + "---:|" * len(sizes),
+    ]
+    for name in names:
+        lines.append(f"| {name} | " + " | ".join(f"{results[name][s]:.2f}" for s in sizes) + " |")
+    with open(path_md, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк на analytics/report заявките.")
+    parser.add_argument("--sizes", default="100000,300000,1000000", help="размери на sales, напр. 1e5,1e6")
+    parser.add_argument("--vendors", type=int, default=10)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--rows-per-day", type=int, default=3000, help="гъстота на историята (всички вендори)")
+    parser.add_argument("--period-days", type=int, default=30, help="период за заявките по период")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--force", action="store_true", help="позволи база, в която вече има продажби")
+    parser.add_argument("--out", default="bench_analytics", help="префикс за .md/.csv отчета")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix="bigarena-analytics-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("PRICE_CACHE_TTL", "0")
+
+    # db чете DATABASE_URL при import-а
+    import db
+    import analytics
+    import report
+    from gen_sales_history import generate_history
+
+    db.init_db()
+    with db.engine.connect() as conn:
+        has_sales = conn.execute(db.select(db.Sale.id).limit(1)).first() is not None
+    if has_sales and not args.force:
+        print("Базата вече има продажби – ползвай празна база или --force.")
+        sys.exit(1)
+
+    sizes = sorted(int(float(s)) for s in args.sizes.split(","))
+    vendor_ids = [1001 + i for i in range(args.vendors)]
+    start = datetime(2024, 1, 1)
+    moment = start
+    have = 0
+    results = {}
+
+    for size in sizes:
+        add = size - have
+        days = add / args.rows_per_day
+        t0 = time.perf_counter()
+        moment = generate_history(add, vendor_ids, args.products, moment, days, args.seed)
+        have = size
+        print(f"   (+{add} реда за {time.perf_counter() - t0:.1f} сек.)")
+
+        last_day = (moment - timedelta(minutes=1)).strftime("%Y-%m-%d")
+        period_from = (moment - timedelta(days=args.period_days)).strftime("%Y-%m-%d")
+        for name, fn in _cases(analytics, report, vendor_ids[0], last_day, period_from):
+            fn()  # загрявка
+            results.setdefault(name, {})[size] = _time_call(fn, args.repeat)
+
+    write_report(results, sizes, args.out + ".md", args.out + ".csv", db.engine.dialect.name)
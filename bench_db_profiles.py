@@ -0,0 +1,193 @@
+"""
+Бенчмарк на профилите на engine-а (DB_PROFILE=default / tuned).
+
+Всеки профил се пуска в отделен процес (engine-ът се създава при import на db)
+върху нова база и мери:
+- write: db.record_run (пътят на монитора) – snapshot на --products продукта
+  с ~2% променени наличности на рън;
+- read: analytics.get_dashboard_snapshot (пътят на dashboard-а);
+- read_under_write: същото четене, докато друг процес пише непрекъснато
+  (+ колко записа/сек. е направил той и брой грешки "database is locked").
+
+    python bench_db_profiles.py --products 2000 --runs 30
+    python bench_db_profiles.py --database-url postgresql://localhost/bench
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROFILES = ("default", "tuned")
+
+
+def _ms(samples):
+    return round(statistics.median(samples) * 1000, 2) if samples else None
+
+
+def _inventory(rng, products: int, previous=None):
+    if previous is None:
+        return {str(i): {"name": f"Продукт {i}", "qty": rng.randint(0, 50)} for i in range(products)}
+    current = {k: dict(v) for k, v in previous.items()}
+    for key in rng.sample(list(current), max(1, products // 50)):
+        current[key]["qty"] = max(0, current[key]["qty"] - rng.randint(1, 3))
+    return current
+
+
+def _sales(previous, current, timestamp):
+    return [
+        {"product_id": k, "product_name": v["name"], "timestamp": timestamp,
+         "quantity": previous[k]["qty"] - v["qty"]}
+        for k, v in current.items()
+        if v["qty"] < previous[k]["qty"]
+    ]
+
+
+def _write_loop(vendor_id: int, products: int, seed: int, stop, errors, done):
+    """Отделен процес, който записва рънове непрекъснато, докато stop не се вдигне."""
+    import db
+
+    rng = random.Random(seed)
+    previous = _inventory(rng, products)
+    db.record_run(vendor_id, [], previous)
+    moment = datetime.now()
+    while not stop.is_set():
+        moment += timedelta(minutes=25)
+        current = _inventory(rng, products, previous)
+        sales = _sales(previous, current, moment.strftime(db.SALE_TIMESTAMP_FORMAT))
+        try:
+            db.record_run(vendor_id, sales, current, previous)
+            previous = current
+            with done.get_lock():
+                done.value += 1
+        except Exception as e:
+            if "locked" not in str(e):
+                raise
+            with errors.get_lock():
+                errors.value += 1
+
+
+def worker(args):
+    """Пуска се в подпроцес с DB_PROFILE и DATABASE_URL от средата; печата JSON."""
+    import db
+    import analytics
+    from gen_sales_history import generate_history
+
+    db.init_db()
+    rng = random.Random(args.seed)
+    vendor_id = 2001
+    generate_history(args.history, [vendor_id], args.products,
+                     datetime.now() - timedelta(days=30), 30, args.seed)
+
+    # write path
+    previous = _inventory(rng, args.products)
+    db.record_run(vendor_id, [], previous)
+    moment = datetime.now()
+    write_samples = []
+    for _ in range(args.runs):
+        moment += timedelta(minutes=25)
+        current = _inventory(rng, args.products, previous)
+        sales = _sales(previous, current, moment.strftime(db.SALE_TIMESTAMP_FORMAT))
+        t0 = time.perf_counter()
+        db.record_run(vendor_id, sales, current, previous)
+        write_samples.append(time.perf_counter() - t0)
+        previous = current
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    period_from = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+
+    def read():
+        analytics.get_dashboard_snapshot(vendor_id, period_from, today)
+
+    read()
+    read_samples = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        read()
+        read_samples.append(time.perf_counter() - t0)
+
+    # четене, докато друг процес пише (като dashboard + монитор)
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    write_errors = ctx.Value("i", 0)
+    writes_done = ctx.Value("i", 0)
+    proc = ctx.Process(target=_write_loop,
+                       args=(vendor_id + 1, args.products, args.seed, stop, write_errors, writes_done))
+    proc.start()
+    time.sleep(1.0)
+    writes_before = writes_done.value
+    started = time.perf_counter()
+
+    contended = []
+    read_errors = 0
+    try:
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            try:
+                read()
+                contended.append(time.perf_counter() - t0)
+            except Exception as e:
+                if "locked" not in str(e):
+                    raise
+                read_errors += 1
+    finally:
+        writes_per_sec = (writes_done.value - writes_before) / (time.perf_counter() - started)
+        stop.set()
+        proc.join()
+
+    print(json.dumps({
+        "profile": os.environ.get("DB_PROFILE"),
+        "dialect": db.engine.dialect.name,
+        "write_ms": _ms(write_samples),
+        "read_ms": _ms(read_samples),
+        "read_under_write_ms": _ms(contended),
+        "writes_per_s_during_reads": round(writes_per_sec, 1),
+        "locked_errors": read_errors + write_errors.value,
+    }))
+
+
+def run_profile(profile: str, args) -> dict:
+    env = dict(os.environ, DB_PROFILE=profile, PRICE_CACHE_TTL="0")
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix=f"bigarena-db-{profile}-")
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker",
+         "--products", str(args.products), "--runs", str(args.runs),
+         "--history", str(args.history), "--seed", str(args.seed)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение на DB_PROFILE=default и tuned.")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--history", type=int, default=100000, help="продажби в историята за четенето")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None,
+                        help="по подразбиране – нов SQLite за всеки профил (при Postgres базата трябва да е празна)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        sys.exit(0)
+
+    results = [run_profile(p, args) for p in PROFILES]
+    header = ["profile", "dialect", "write_ms", "read_ms", "read_under_write_ms",
+              "writes_per_s_during_reads", "locked_errors"]
+    print(f"\n=== DB профили: {args.products} продукта, {args.runs} ръна, {args.history} продажби история ===")
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    for r in results:
+        print("| " + " | ".join(str(r[h]) for h in header) + " |")
@@ -0,0 +1,142 @@
+"""
+End-to-end бенчмарк: run_all.py срещу локалния fake_bigarena сървър.
+
+Пуска N синтетични вендора с по M продукта, изпълнява run_all.py няколко пъти
+(първият рън е началният snapshot, следващите – след tick() с продажби)
+и отчита за всеки рън: wall time, DB време (db_read + db_write от метриките),
+пиков RSS на процеса на монитора и брой засечени продажби.
+
+    python bench_e2e.py --vendors 10 --products 2000 --runs 3
+    python bench_e2e.py --vendors 50 --products 500 --json bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_bigarena import running_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _read_metrics(path: str):
+    """Последният run_id от metrics JSONL файла → списък от записи."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return []
+    last_run = records[-1]["run_id"]
+    return [r for r in records if r["run_id"] == last_run]
+
+
+def _run_monitor(env: dict, cwd: str, log_path: str, extra_args):
+    """Пуска run_all.py като подпроцес; връща (exit_code, wall_s, peak_rss_mb)."""
+    started = time.perf_counter()
+    with open(log_path, "a", encoding="utf-8") as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "run_all.py"), *extra_args],
+            cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        # wait4 дава rusage точно на този подпроцес (ru_maxrss е в KB на Linux)
+        _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, wall, rusage.ru_maxrss / 1024
+
+
+def run_benchmark(vendors: int, products: int, variants: int, sales_per_tick: int,
+                  runs: int, seed: int = 42, database_url: str = None,
+                  extra_args=(), workdir: str = None):
+    """Изпълнява бенчмарка и връща списък с резултати по рънове."""
+    workdir = workdir or tempfile.mkdtemp(prefix="bigarena-bench-")
+    vendor_ids = [1001 + i for i in range(vendors)]
+
+    vendors_file = os.path.join(workdir, "vendors.json")
+    with open(vendors_file, "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {
+                    "name": f"Vendor{vid}",
+                    "vendor_id": vid,
+                    "state_file": f"vendor{vid}_state.json",
+                    "log_file": f"vendor{vid}_sales_log.txt",
+                }
+                for vid in vendor_ids
+            ],
+            f,
+        )
+
+    metrics_file = os.path.join(workdir, "metrics.jsonl")
+    results = []
+
+    with running_server(vendors=vendor_ids, products=products, variants=variants,
+                        sales_per_tick=sales_per_tick, seed=seed) as server:
+        env = {
+            **os.environ,
+            "BIGARENA_BASE_URL": server.base_url,
+            "BIGARENA_EMAIL": "bench@example.invalid",
+            "BIGARENA_PASSWORD": "bench",
+            "BIGARENA_REQUEST_DELAY": os.getenv("BIGARENA_REQUEST_DELAY", "0"),
+            "DATABASE_URL": database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "VENDORS_FILE": vendors_file,
+            "METRICS_FILE": metrics_file,
+            "PYTHONPATH": HERE,
+        }
+
+        for run in range(runs):
+            if run > 0:
+                server.catalog.tick()
+
+            code, wall, rss_mb = _run_monitor(env, workdir, os.path.join(workdir, "run_all.log"), extra_args)
+            records = [r for r in _read_metrics(metrics_file) if r["vendor_id"] is not None]
+            db_time = sum(r["stages"].get("db_read", 0) + r["stages"].get("db_write", 0) for r in records)
+            results.append({
+                "run": run + 1,
+                "exit_code": code,
+                "wall_s": round(wall, 3),
+                "db_s": round(db_time, 3),
+                "http_s": round(sum(r["stages"].get("http_fetch", 0) for r in records), 3),
+                "peak_rss_mb": round(rss_mb, 1),
+                "vendors_ok": sum(1 for r in records if r["ok"]),
+                "sales": sum(r["counters"].get("sales", 0) for r in records),
+            })
+
+    return results, workdir
+
+
+def print_results(results, vendors: int, products: int):
+    print(f"\n=== bench_e2e: {vendors} vendors x {products} products ===")
+    header = ["run", "exit_code", "wall_s", "db_s", "http_s", "peak_rss_mb", "vendors_ok", "sales"]
+    print("  ".join(f"{h:>11}" for h in header))
+    for r in results:
+        print("  ".join(f"{r[h]!s:>11}" for h in header))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end бенчмарк на run_all.py срещу fake BigArena.")
+    parser.add_argument("--vendors", type=int, default=3)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--variants", type=int, default=3)
+    parser.add_argument("--sales-per-tick", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None, help="по подразбиране – нов SQLite във временна папка")
+    parser.add_argument("--json", default=None, help="запиши резултатите и в този JSON файл")
+    parser.add_argument("run_all_args", nargs="*", help="аргументи към run_all.py (след --)")
+    args = parser.parse_args()
+
+    results, workdir = run_benchmark(
+        args.vendors, args.products, args.variants, args.sales_per_tick,
+        args.runs, args.seed, args.database_url, args.run_all_args,
+    )
+    print_results(results, args.vendors, args.products)
+    print(f"\nЛогове и база: {workdir}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vendors": args.vendors, "products": args.products, "results": results}, f, indent=2)
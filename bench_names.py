@@ -0,0 +1,61 @@
+"""
+Микробенчмарк на clean_product_name: старата версия (inline regex, без кеш)
+срещу текущата (компилирани шаблони + LRU кеш по суровия HTML).
+
+Имената идват от fake_bigarena.FakeCatalog (същия HTML като в API-то).
+Мери се цена на продукт за първи рън (студен кеш) и за следващите (топъл).
+
+    python bench_names.py --products 10000 --runs 5
+"""
+import argparse
+import html
+import re
+import time
+
+from fake_bigarena import FakeCatalog
+from monitor import clean_product_name
+
+
+def clean_product_name_old(raw_html_name: str) -> str:
+    """Версията отпреди кеша – за сравнение."""
+    if not raw_html_name:
+        return "Unknown Product"
+    decoded_html = html.unescape(raw_html_name)
+    match = re.search(r'class="item-data-title">([^<]+)<', decoded_html)
+    if match:
+        return match.group(1).strip()
+    return re.sub(r"<[^>]+>", "", decoded_html).strip()
+
+
+def _per_product_us(fn, names, runs: int):
+    """Връща (първи рън, медиана на следващите) в µs на продукт."""
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for name in names:
+            fn(name)
+        times.append((time.perf_counter() - t0) / len(names) * 1e6)
+    rest = sorted(times[1:]) or times
+    return times[0], rest[len(rest) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Микробенчмарк на clean_product_name.")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5, help="рънове върху същия каталог")
+    args = parser.parse_args()
+
+    catalog = FakeCatalog([1001], products=args.products, variants=1)
+    names = [p["name"] for p in catalog.products[1001]]
+
+    assert all(clean_product_name(n) == clean_product_name_old(n) for n in names[:100])
+    clean_product_name.cache_clear()
+
+    old_first, old_next = _per_product_us(clean_product_name_old, names, args.runs)
+    new_first, new_next = _per_product_us(clean_product_name, names, args.runs)
+
+    print(f"=== clean_product_name: {len(names)} продукта, {args.runs} ръна ===")
+    print(f"{'':12}{'1-ви рън':>12}{'следващи':>12}  (µs/продукт)")
+    print(f"{'стара':12}{old_first:12.2f}{old_next:12.2f}")
+    print(f"{'нова':12}{new_first:12.2f}{new_next:12.2f}")
+    print(f"кеш: {clean_product_name.cache_info()}")
@@ -1,9 +1,33 @@
-import requests
+import json
+import os
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
 from config import BIGARENA_EMAIL, BIGARENA_PASSWORD
 
-LOGIN_URL = "https://my.bigarena.net/login"
-API_URL = "https://my.bigarena.net/orders/get-products"
+# JSON бекенди по избор: orjson (бърз парсер), ijson (стрийминг), иначе stdlib
+try:
+    import orjson
+except ImportError:  # pragma: no cover - зависи от средата
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - зависи от средата
+    ijson = None
+
+# BIGARENA_BASE_URL позволява насочване към локален сървър (fake_bigarena.py)
+BASE_URL = os.getenv("BIGARENA_BASE_URL", "https://my.bigarena.net").rstrip("/")
+LOGIN_URL = f"{BASE_URL}/login"
+API_URL = f"{BASE_URL}/orders/get-products"
 
 # Създаваме сесия (помни бисквитките)
 session = requests.Session()
@@ -11,9 +35,179 @@ session = requests.Session()
 # Базови хедъри
 session.headers.update({
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/123.0.0.0 Safari/537.36",
-    "Referer": "https://my.bigarena.net/"
+    "Referer": f"{BASE_URL}/",
+    # get-products отговорите са големи JSON-и – искаме ги компресирани
+    "Accept-Encoding": "gzip, deflate",
 })
 
+# Минимален интервал (сек.) между две заявки към един и същ хост.
+# Заменя глобалния time.sleep между вендорите – важи и при паралелна работа.
+REQUEST_DELAY = float(os.getenv("BIGARENA_REQUEST_DELAY", "1.0"))
+
+_host_lock = threading.Lock()
+_host_next_slot = {}
+
+# Размер на страница при извличане на продукти (DataTables start/length)
+PAGE_SIZE = int(os.getenv("BIGARENA_PAGE_SIZE", "500"))
+# Колко страници да се теглят паралелно, след като знаем общия брой
+PAGE_WORKERS = int(os.getenv("BIGARENA_PAGE_WORKERS", "1"))
+
+# Как се декодира get-products: stream (ijson – поточно, без да се буферира
+# тялото и без цялото дърво на страницата), orjson (бърз, но буферира), json
+# или auto – първото налично от stream → orjson → json.
+JSON_DECODER = os.getenv("BIGARENA_JSON_DECODER", "auto")
+_STREAM_CHUNK = 64 * 1024
+
+# Файл за бисквитките и CSRF токена между рънове (права 0600); празно = без кеш
+SESSION_CACHE_FILE = os.getenv("BIGARENA_SESSION_CACHE", ".bigarena_session.json")
+
+# Timeout-и (сек.) за връзка и за четене – увиснал сокет не спира целия рън
+CONNECT_TIMEOUT = float(os.getenv("BIGARENA_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("BIGARENA_READ_TIMEOUT", "60"))
+# Повторни опити при мрежова грешка / 5xx (exponential backoff с jitter)
+MAX_RETRIES = int(os.getenv("BIGARENA_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("BIGARENA_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("BIGARENA_BACKOFF_MAX", "30"))
+RETRY_STATUSES = (500, 502, 503, 504)
+# Размер на пула връзки; 0 = според паралелизма (вж. configure_pool)
+POOL_SIZE = int(os.getenv("BIGARENA_POOL_SIZE", "0"))
+
+# Общ лимит на едновременните заявки към BigArena (Semaphore; None = без лимит).
+# При --processes в run_all.py е multiprocessing семафор, общ за всички процеси.
+_inflight = None
+
+# Само един login наведнъж, иначе паралелните нишки си чистят бисквитките
+_login_lock = threading.Lock()
+
+
+class FetchError(RuntimeError):
+    """Неуспешно извличане на продукти (мрежа, HTTP статус, невалиден JSON)."""
+
+
+class SessionExpiredError(FetchError):
+    """Сесията е изтекла (419) – нужен е нов login."""
+
+
+def set_request_delay(seconds: float):
+    """Задава минималния интервал между заявки към един хост."""
+    global REQUEST_DELAY
+    REQUEST_DELAY = max(0.0, float(seconds))
+
+
+def _wait_for_host(url: str):
+    """
+    Изчаква, докато дойде редът на следващата заявка към хоста на url.
+    Всяка нишка си "запазва" слот, така че заявките се разреждат равномерно.
+    """
+    host = urlsplit(url).netloc
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_next_slot.get(host, 0.0))
+        _host_next_slot[host] = slot + REQUEST_DELAY
+
+    if slot > now:
+        time.sleep(slot - now)
+
+# === ТРАНСПОРТ ===
+
+def configure_pool(concurrency: int = 1):
+    """
+    Монтира HTTPAdapter с пул, достатъчен за concurrency вендора
+    по PAGE_WORKERS страници едновременно (или BIGARENA_POOL_SIZE).
+    Повторните опити са наши (_request), затова max_retries=0.
+    """
+    size = POOL_SIZE or max(10, max(1, concurrency) * max(1, PAGE_WORKERS))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+configure_pool()
+
+
+def set_request_limiter(semaphore):
+    """Задава семафор, който ограничава едновременните заявки (None = без лимит)."""
+    global _inflight
+    _inflight = semaphore
+
+
+def _release_on_close(resp: requests.Response, release):
+    """При stream=True тялото се чете след връщането – мястото се освобождава при resp.close()."""
+    close = resp.close
+    released = False
+
+    def close_and_release():
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                release()
+
+    resp.close = close_and_release
+
+
+def _send(method: str, url: str, stage: str = None, **kwargs) -> requests.Response:
+    """
+    Една заявка: първо място в общия лимит (_inflight), после редът по хост –
+    така чакащата за лимита нишка не "изгаря" слота си. При stream=True мястото
+    се държи, докато отговорът не бъде затворен (тялото още не е изтеглено).
+    """
+    if _inflight is not None:
+        _inflight.acquire()
+    try:
+        _wait_for_host(url)
+        if stage:
+            with metrics.stage(stage):
+                resp = session.request(method, url, **kwargs)
+        else:
+            resp = session.request(method, url, **kwargs)
+    except BaseException:
+        if _inflight is not None:
+            _inflight.release()
+        raise
+
+    if _inflight is not None:
+        if kwargs.get("stream"):
+            _release_on_close(resp, _inflight.release)
+        else:
+            _inflight.release()
+    return resp
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff с "full jitter": случайно в [0, base * 2^attempt]."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _request(method: str, url: str, stage: str = None, **kwargs) -> requests.Response:
+    """
+    Заявка през общата сесия: общ лимит и изчакване по хост (_send), timeout-и и до MAX_RETRIES
+    повторни опита при мрежова грешка или 5xx. Ако опитите свършат,
+    последният отговор се връща, а последната грешка се вдига.
+    stage – етап в metrics за самата заявка (без паузите).
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            resp = _send(method, url, stage, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            reason = type(e).__name__
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                return resp
+            reason = f"status {resp.status_code}"
+            resp.close()
+
+        delay = _backoff(attempt)
+        metrics.add("retries")
+        print(f"🔁 {urlsplit(url).path}: {reason}, нов опит след {delay:.1f} сек. ({attempt + 1}/{MAX_RETRIES})")
+        time.sleep(delay)
+
+
 def get_csrf_from_html(html_text: str):
     """Вади CSRF токена от meta tag или hidden input."""
     match = re.search(r'<meta name="csrf-token" content="(.*?)">', html_text)
@@ -28,10 +222,127 @@ def get_csrf_from_html(html_text: str):
 
 def login() -> bool:
     """Влиза в акаунта и настройва CSRF токените в session headers."""
+    with _login_lock, metrics.stage("login"):
+        ok = _login()
+        if ok:
+            save_session()
+        return ok
+
+
+# === КЕШ НА СЕСИЯТА ===
+
+def save_session():
+    """Записва бисквитките и X-CSRF-TOKEN в SESSION_CACHE_FILE (само за собственика)."""
+    token = session.headers.get("X-CSRF-TOKEN")
+    if not SESSION_CACHE_FILE or not token:
+        return
+    data = {
+        "base_url": BASE_URL,
+        "saved_at": time.time(),
+        "csrf_token": token,
+        "cookies": [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "expires": c.expires,
+                "secure": c.secure,
+            }
+            for c in session.cookies
+        ],
+    }
+    tmp_path = SESSION_CACHE_FILE + ".tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, SESSION_CACHE_FILE)
+    except OSError as e:
+        print(f"⚠️ Не мога да запиша кеша на сесията: {e}")
+
+
+def load_session() -> bool:
+    """
+    Зарежда бисквитките и CSRF токена от SESSION_CACHE_FILE.
+    Връща True, ако има годен запис за същия BASE_URL (валидността му
+    се разбира чак при първата API заявка – 419 значи нов login).
+    """
+    if not SESSION_CACHE_FILE or not os.path.exists(SESSION_CACHE_FILE):
+        return False
+    try:
+        with open(SESSION_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if data.get("base_url") != BASE_URL or not data.get("csrf_token"):
+        return False
+
+    now = time.time()
+    for c in data.get("cookies", []):
+        if c.get("expires") and c["expires"] < now:
+            continue
+        session.cookies.set(
+            c["name"], c["value"],
+            domain=c.get("domain", ""), path=c.get("path", "/"),
+            expires=c.get("expires"), secure=c.get("secure", False),
+        )
+    session.headers.update({
+        "X-CSRF-TOKEN": data["csrf_token"],
+        "X-Requested-With": "XMLHttpRequest",
+    })
+    return True
+
+
+def clear_session():
+    """Забравя текущата сесия (бисквитки, CSRF и кеш файла) – напр. след 419."""
+    session.cookies.clear()
+    session.headers.pop("X-CSRF-TOKEN", None)
+    if SESSION_CACHE_FILE:
+        try:
+            os.remove(SESSION_CACHE_FILE)
+        except FileNotFoundError:
+            pass
+
+
+def _relogin(stale_token: str) -> bool:
+    """
+    Нов login след 419, общ за всички нишки (single-flight): ако докато сме
+    чакали lock-а друга нишка вече е сменила токена, ползваме нейната сесия.
+    """
+    with _login_lock:
+        token = session.headers.get("X-CSRF-TOKEN")
+        if token and token != stale_token:
+            return True
+        print("🔄 Сесията е изтекла (419) – нов вход...")
+        clear_session()
+        with metrics.stage("login"):
+            ok = _login()
+        if ok:
+            save_session()
+        return ok
+
+
+def ensure_logged_in() -> bool:
+    """
+    Готова сесия без излишен login: вече логнати → нищо; иначе кешът
+    от предишен рън; иначе пълен login().
+    """
+    with _login_lock:
+        if session.headers.get("X-CSRF-TOKEN"):
+            return True
+        if load_session():
+            print("🔑 Сесията е заредена от кеша.")
+            return True
+    return login()
+
+
+def _login() -> bool:
     print("⏳ Опит за автоматичен вход...")
 
     try:
-        resp = session.get(LOGIN_URL)
+        resp = _request("GET", LOGIN_URL)
         token = get_csrf_from_html(resp.text)
 
         if not token:
@@ -45,7 +356,7 @@ def login() -> bool:
             "remember": "on"
         }
 
-        post_resp = session.post(LOGIN_URL, data=payload)
+        post_resp = _request("POST", LOGIN_URL, data=payload)
 
         if post_resp.status_code == 200:
             # опит да извадим токен от HTML
@@ -76,33 +387,240 @@ def login() -> bool:
         print(f"Грешка при логин: {e}")
         return False
 
-def get_products_for_vendor(vendor_id: int):
-    """Взима продуктите за даден vendor_id чрез логнатата сесия."""
+# === ДЕКОДИРАНЕ НА get-products ===
+# process_inventory ползва само id, name и variants[].on_hand_quantity,
+# затова от отговора пазим само тях (плюс броячите на DataTables).
+
+_BODY_FIELDS = ("draw", "recordsTotal", "recordsFiltered")
+
+if ijson is not None:
+    _JSON_ERRORS = (ValueError, ijson.JSONError)
+else:
+    _JSON_ERRORS = (ValueError,)
+
+
+def _resolve_decoder(name: str) -> str:
+    available = {"orjson": orjson is not None, "stream": ijson is not None, "json": True}
+    if name != "auto" and available.get(name):
+        return name
+    if name != "auto":
+        print(f"⚠️ JSON декодер '{name}' не е наличен – ползвам auto.")
+    return next(n for n in ("stream", "orjson", "json") if available[n])
+
+
+_decoder = _resolve_decoder(JSON_DECODER)
+
+
+def _compact_product(prod: dict) -> dict:
+    return {
+        "id": prod.get("id"),
+        "name": prod.get("name", ""),
+        "variants": [
+            {"on_hand_quantity": v.get("on_hand_quantity", 0)}
+            for v in prod.get("variants") or []
+        ],
+    }
+
+
+def _compact_body(body) -> dict:
+    """Само полетата, които ползваме; FetchError, ако отговорът не е DataTables обект."""
+    data = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(body, dict) or not isinstance(data or [], list):
+        raise FetchError("Отговорът не е валиден DataTables JSON обект.")
+    compact = {k: body[k] for k in _BODY_FIELDS if k in body}
+    compact["data"] = [_compact_product(p) for p in data or [] if isinstance(p, dict)]
+    return compact
+
+
+class _ChunkReader:
+    """File-like обвивка около resp.iter_content за ijson; брои получените байтове."""
+
+    def __init__(self, resp):
+        self._chunks = resp.iter_content(_STREAM_CHUNK)
+        self._buf = b""
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buf) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self.bytes += len(chunk)
+            self._buf += chunk
+        if size < 0:
+            data, self._buf = self._buf, b""
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def _stream_body(reader) -> dict:
+    """
+    Парсва DataTables отговора събитие по събитие (ijson) и строи директно
+    компактната структура – HTML атрибути, SKU-та и т.н. не се материализират.
+    """
+    body = {"data": []}
+    product = variant = None
+
+    events = ijson.parse(reader)
+    first = next(events, None)
+    if first is None or first[:2] != ("", "start_map"):
+        raise FetchError("Отговорът не е валиден DataTables JSON обект.")
+
+    for prefix, event, value in events:
+        if prefix == "data.item":
+            if event == "start_map":
+                product = {"id": None, "name": "", "variants": []}
+            elif event == "end_map":
+                body["data"].append(product)
+                product = None
+        elif product is not None:
+            if prefix == "data.item.id":
+                product["id"] = value
+            elif prefix == "data.item.name":
+                product["name"] = value
+            elif prefix == "data.item.variants.item":
+                if event == "start_map":
+                    variant = {"on_hand_quantity": 0}
+                elif event == "end_map":
+                    product["variants"].append(variant)
+                    variant = None
+            elif prefix == "data.item.variants.item.on_hand_quantity" and variant is not None:
+                variant["on_hand_quantity"] = value
+        elif prefix in _BODY_FIELDS:
+            body[prefix] = value
+
+    return body
+
+
+def _fetch_page(vendor_id: int, start: int, length: int, draw: int) -> dict:
+    """
+    Взима една страница от get-products и връща компактен dict
+    ({"data": [{"id", "name", "variants": [{"on_hand_quantity"}]}], "recordsTotal", ...}).
+    При 419 влиза наново (веднъж); при проблем вдига FetchError.
+    """
     payload = {
-        "draw": "1",
-        "start": "0",
-        "length": "2000",
+        "draw": str(draw),
+        "start": str(start),
+        "length": str(length),
         "vendor_id": str(vendor_id),
         "search[value]": "",
         "search[regex]": "false"
     }
 
-    try:
-        resp = session.post(API_URL, data=payload)
+    # при 419 – един общ нов login и още един опит
+    for attempt in range(2):
+        token = session.headers.get("X-CSRF-TOKEN")
+        try:
+            resp = _request("POST", API_URL, stage="http_fetch", data=payload,
+                            stream=_decoder == "stream")
+        except requests.RequestException as e:
+            raise FetchError(f"Connection Error: {e}") from e
+
+        metrics.add("pages")
+        if resp.status_code != 419 or attempt > 0:
+            break
+        resp.close()
+        if not _relogin(token):
+            raise SessionExpiredError("Сесията е изтекла (419), а новият вход е неуспешен.")
+
+    with resp:
+        if resp.status_code == 419:
+            raise SessionExpiredError("Сесията е изтекла (419).")
+        if resp.status_code != 200:
+            raise FetchError(f"Status {resp.status_code}")
+
+        try:
+            if _decoder == "stream":
+                # тялото се чете и парсва наведнъж, затова времето отива в json_parse
+                reader = _ChunkReader(resp)
+                try:
+                    with metrics.stage("json_parse"):
+                        return _stream_body(reader)
+                finally:
+                    metrics.add("bytes_received", reader.bytes)
+
+            metrics.add("bytes_received", len(resp.content))
+            with metrics.stage("json_parse"):
+                loads = orjson.loads if _decoder == "orjson" else json.loads
+                return _compact_body(loads(resp.content))
+        except requests.RequestException as e:
+            raise FetchError(f"Connection Error: {e}") from e
+        except _JSON_ERRORS as e:
+            raise FetchError("Отговорът не е валиден JSON.") from e
+
 
-        if resp.status_code == 200:
+def _records_total(body: dict):
+    """Общ брой записи според DataTables (recordsFiltered е след филтъра по vendor)."""
+    for key in ("recordsFiltered", "recordsTotal"):
+        value = body.get(key)
+        if value is not None:
             try:
-                return resp.json().get("data", [])
-            except Exception:
-                print("Грешка: Отговорът не е валиден JSON.")
-                return None
-        elif resp.status_code == 419:
-            print("⚠️ Сесията е изтекла (419).")
-            return "RETRY"
-        else:
-            print(f"ГРЕШКА: Status {resp.status_code}")
-            return None
+                return int(value)
+            except (TypeError, ValueError):
+                pass
+    return None
 
-    except Exception as e:
-        print(f"Connection Error: {e}")
+
+def iter_products_for_vendor(vendor_id: int, page_size: int = None, workers: int = None):
+    """
+    Генератор на продуктите (dict-ове) за даден vendor_id, страница по страница.
+    Спира според recordsTotal от първия отговор; ако сървърът не го връща –
+    докато не дойде непълна страница. При workers > 1 останалите страници
+    се теглят паралелно, но се връщат в реда им.
+    При грешка или непълен резултат (по-малко от recordsTotal) вдига
+    FetchError / SessionExpiredError.
+    """
+    page_size = page_size or PAGE_SIZE
+    workers = workers or PAGE_WORKERS
+
+    body = _fetch_page(vendor_id, 0, page_size, draw=1)
+    rows = body.get("data") or []
+    total = _records_total(body)
+    yield from rows
+    fetched = len(rows)
+
+    if total is None:
+        while len(rows) >= page_size:
+            body = _fetch_page(vendor_id, fetched, page_size, draw=fetched // page_size + 1)
+            rows = body.get("data") or []
+            yield from rows
+            fetched += len(rows)
+        return
+
+    # Ако сървърът реже length, ползваме реалния размер на страницата
+    step = len(rows) if 0 < len(rows) < page_size else page_size
+    starts = list(range(step, total, step))
+
+    if workers > 1 and len(starts) > 1:
+        fetch_page = metrics.bind(_fetch_page)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(fetch_page, vendor_id, start, step, n + 2)
+                for n, start in enumerate(starts)
+            ]
+            for fut in futures:
+                rows = fut.result().get("data") or []
+                yield from rows
+                fetched += len(rows)
+    else:
+        for n, start in enumerate(starts):
+            rows = _fetch_page(vendor_id, start, step, draw=n + 2).get("data") or []
+            yield from rows
+            fetched += len(rows)
+
+    if fetched < total:
+        # непълен snapshot не бива да се записва – липсващите продукти ще изглеждат изтрити
+        raise FetchError(f"Vendor {vendor_id}: получени {fetched} от {total} продукта.")
+
+
+def get_products_for_vendor(vendor_id: int):
+    """
+    Взима всички продукти за даден vendor_id чрез логнатата сесия (всички страници).
+    Връща списък или None при грешка (изтеклата сесия се подновява автоматично).
+    """
+    try:
+        return list(iter_products_for_vendor(vendor_id))
+    except FetchError as e:
+        print(f"ГРЕШКА: {e}")
         return None
@@ -0,0 +1,185 @@
+"""
+Дълго работещ режим на мониторинга (алтернатива на cron + run_all.py).
+
+Сесията към BigArena и engine-ът на базата остават "топли", а всеки вендор
+има собствен интервал според скоростта на продажбите си през последните
+дни (daily_vendor_revenue): колкото повече продава, толкова по-често се
+проверява – в границите [--min-interval, --max-interval].
+
+    python daemon.py --concurrency 4 --min-interval 300 --max-interval 3600
+
+Спира чисто на SIGTERM / SIGINT (изчаква текущите проверки).
+"""
+import argparse
+import heapq
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import db
+import metrics
+from db_writer import DbWriter
+from bigarena_client import configure_pool, ensure_logged_in, set_request_delay
+from monitor import run_vendor
+from run_all import DEFAULT_CONCURRENCY, DEFAULT_REQUEST_DELAY
+from vendors_config import VENDORS
+
+# Граници на интервала между две проверки на един вендор (сек.)
+MIN_INTERVAL = float(os.getenv("DAEMON_MIN_INTERVAL", "300"))
+MAX_INTERVAL = float(os.getenv("DAEMON_MAX_INTERVAL", "3600"))
+# Колко продадени бройки искаме средно между две проверки
+TARGET_SALES_PER_POLL = float(os.getenv("DAEMON_TARGET_SALES", "3"))
+# Прозорец (дни) за скоростта на продажбите и колко често да се преизчислява (сек.)
+VELOCITY_DAYS = int(os.getenv("DAEMON_VELOCITY_DAYS", "7"))
+VELOCITY_REFRESH = float(os.getenv("DAEMON_VELOCITY_REFRESH", "600"))
+# Пауза преди нов опит за глобален login (сек.)
+LOGIN_RETRY = float(os.getenv("DAEMON_LOGIN_RETRY", "60"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг като daemon с адаптивни интервали по вендор.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="брой вендори, проверявани едновременно")
+    parser.add_argument("--delay", type=float, default=DEFAULT_REQUEST_DELAY,
+                        help="минимална пауза между заявки към BigArena в сек.")
+    parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL,
+                        help=f"най-краткият интервал за вендор в сек. (по подразбиране {MIN_INTERVAL:.0f})")
+    parser.add_argument("--max-interval", type=float, default=MAX_INTERVAL,
+                        help=f"най-дългият интервал за вендор в сек. (по подразбиране {MAX_INTERVAL:.0f})")
+    parser.add_argument("--target-sales", type=float, default=TARGET_SALES_PER_POLL,
+                        help="желани продадени бройки между две проверки")
+    return parser.parse_args(argv)
+
+
+def vendor_interval(units_per_hour: float, min_interval: float, max_interval: float,
+                    target_sales: float = TARGET_SALES_PER_POLL) -> float:
+    """Интервал (сек.), за който вендорът средно продава target_sales бройки."""
+    if units_per_hour <= 0:
+        return max_interval
+    interval = target_sales / units_per_hour * 3600
+    return min(max_interval, max(min_interval, interval))
+
+
+class Scheduler:
+    """
+    Heap от (следващ старт, вендор). Всеки вендор се пуска веднага при старт,
+    след това – през vendor_interval() според последно изчислената скорост.
+    """
+
+    def __init__(self, vendors, args, writer=None):
+        self.args = args
+        self.writer = writer
+        self.stop = threading.Event()
+        self.velocity = {}
+        self.velocity_at = 0.0
+        self.latest = {}  # име → последен metrics запис (за Prometheus файла)
+        self.heap = []
+        now = time.monotonic()
+        for n, v in enumerate(vendors):
+            heapq.heappush(self.heap, (now, n, v))
+
+    def refresh_velocity(self, force: bool = False):
+        if not force and time.monotonic() - self.velocity_at < VELOCITY_REFRESH:
+            return
+        try:
+            self.velocity = db.get_sales_velocity(VELOCITY_DAYS)
+        except Exception as e:
+            print(f"⚠️ Неуспешно изчисляване на скоростта на продажбите: {e}")
+        self.velocity_at = time.monotonic()
+
+    def next_interval(self, v, ok: bool) -> float:
+        if not ok:
+            # при грешка опитваме отново по-скоро
+            return self.args.min_interval
+        return vendor_interval(
+            self.velocity.get(v["vendor_id"], 0.0),
+            self.args.min_interval, self.args.max_interval, self.args.target_sales,
+        )
+
+    def _finished(self, fut, n, v):
+        m = fut.result()
+        # Неуспешен запис в базата → вендорът е неуспешен (както в run_all.run_vendors)
+        write_errors = self.writer.pop_errors(v["vendor_id"]) if self.writer is not None else []
+        if m.ok and write_errors:
+            m.ok = False
+            m.error = f"запис в базата: {write_errors[-1]}"
+        record = m.to_dict()
+        self.latest[m.name] = record
+        metrics.write_jsonl([record])
+        metrics.write_prometheus(list(self.latest.values()))
+
+        if m.ok and m.counters.get("sales"):
+            # run_for_vendor връща след commit-а, така че новите продажби вече са в rollup-ите
+            self.refresh_velocity(force=True)
+        interval = self.next_interval(v, m.ok)
+        heapq.heappush(self.heap, (time.monotonic() + interval, n, v))
+
+        status = "✅" if m.ok else f"❌ {m.error}"
+        print(f"⏱️ {m.name}: {status} ({m.wall:.1f} сек.) – следваща проверка след {interval / 60:.0f} мин.")
+
+    def run(self):
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.args.concurrency)) as pool:
+            while not self.stop.is_set():
+                self.refresh_velocity()
+
+                # пускаме всички, на които им е дошъл редът (докато има свободни нишки)
+                now = time.monotonic()
+                while self.heap and self.heap[0][0] <= now and len(running) < self.args.concurrency:
+                    _, n, v = heapq.heappop(self.heap)
+                    running[pool.submit(run_vendor, v, self.writer)] = (n, v)
+
+                # будим се поне веднъж в секунда, за да реагираме на сигнал
+                timeout = 1.0
+                if self.heap and len(running) < self.args.concurrency:
+                    timeout = min(timeout, max(0.0, self.heap[0][0] - now))
+
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        self._finished(fut, *running.pop(fut))
+                else:
+                    self.stop.wait(timeout)
+
+            if running:
+                print(f"⏳ Изчаквам {len(running)} текущи проверки...")
+                for fut in list(running):
+                    fut.result()
+                    self._finished(fut, *running.pop(fut))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    set_request_delay(args.delay)
+    configure_pool(args.concurrency)
+    scheduler = Scheduler(VENDORS, args)
+
+    def _stop(signum, frame):
+        print(f"\n🛑 Получен сигнал {signal.Signals(signum).name} – спирам след текущите проверки.")
+        scheduler.stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    print(f"=== Daemon за {len(VENDORS)} вендора (интервали {args.min_interval:.0f}–{args.max_interval:.0f} сек.) ===")
+
+    # Глобален login – при неуспех опитваме пак, докато не ни спрат
+    while not ensure_logged_in():
+        print(f"❌ Неуспешен логин, нов опит след {LOGIN_RETRY:.0f} сек.")
+        if scheduler.stop.wait(LOGIN_RETRY):
+            return 1
+
+    db.init_db()
+    scheduler.refresh_velocity(force=True)
+    with DbWriter() as writer:
+        scheduler.writer = writer
+        scheduler.run()
+    print("=== Daemon-ът спря ===")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,15 @@
+import os
+
 import streamlit as st
 import pandas as pd
 
+from db import init_db
 from analytics import (
+    get_data_version,
     get_vendors_list,
-    get_daily_revenue_df,
     get_product_revenue_for_date,
     get_vendor_date_bounds,
-    get_vendor_stats_for_period,
-    get_top_products_for_period,
-    get_all_vendors_revenue_for_period,
+    get_dashboard_snapshot,
 )
 
 # Мап по желание от vendor_id -> име
@@ -20,6 +21,37 @@ VENDOR_NAMES = {
 }
 
 
+# === КЕШ НА АНАЛИЗИТЕ ===
+# Streamlit преизпълнява целия скрипт при всяко действие, затова резултатите
+# се кешират (споделено между всички отворени сесии). Ключът включва
+# data_version, така че кешът се обновява веднага щом дойдат нови продажби
+# или се променят цени; старите записи изпадат по TTL / max_entries.
+CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "256"))
+
+_cache = st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+
+
+@_cache
+def cached_vendors_list(data_version: str):
+    return get_vendors_list()
+
+
+@_cache
+def cached_vendor_date_bounds(vendor_id: int, data_version: str):
+    return get_vendor_date_bounds(vendor_id)
+
+
+@_cache
+def cached_dashboard_snapshot(vendor_id: int, date_from: str, date_to: str, top_limit: int, data_version: str):
+    return get_dashboard_snapshot(vendor_id, date_from, date_to, top_limit=top_limit)
+
+
+@_cache
+def cached_product_revenue_for_date(vendor_id: int, date_str: str, data_version: str):
+    return get_product_revenue_for_date(vendor_id, date_str)
+
+
 def format_vendor(vid: int) -> str:
     return f"{VENDOR_NAMES.get(vid, 'Vendor ' + str(vid))} (ID: {vid})"
 
@@ -30,7 +62,13 @@ def main():
     st.title("📊 BigArena Vendor Dashboard")
 
     # ===== SIDEBAR: избор на vendor и период =====
-    vendor_ids = get_vendors_list()
+    # Схема/миграции (веднъж на процес) – dashboard-ът може да тръгне преди монитора
+    init_db()
+
+    # Една малка заявка на rerun; всичко останало идва от кеша, докато версията не се смени
+    data_version = get_data_version()
+
+    vendor_ids = cached_vendors_list(data_version)
     if not vendor_ids:
         st.error("Няма намерени vendor-и в базата (sales/product_prices). Увери се, че има данни.")
         return
@@ -46,7 +84,7 @@ def main():
     st.sidebar.markdown(f"**Избран vendor ID:** `{vendor_id}`")
 
     # Граници на датите за избрания vendor
-    min_date_str, max_date_str = get_vendor_date_bounds(vendor_id)
+    min_date_str, max_date_str = cached_vendor_date_bounds(vendor_id, data_version)
     if not min_date_str or not max_date_str:
         st.warning("Няма записани продажби за този vendor.")
         return
@@ -83,9 +121,13 @@ def main():
     # ===== 1. По дни за избрания vendor (за избрания период) =====
     st.subheader("📅 Оборот по дни (за избрания vendor и период)")
 
-    daily_df, total_revenue, total_qty, avg_per_day = get_vendor_stats_for_period(
-        vendor_id, date_from_str, date_to_str
-    )
+    # Всичко за изгледа (серия, KPI, дати, TOP, overview) идва с една заявка
+    snapshot = cached_dashboard_snapshot(vendor_id, date_from_str, date_to_str, 20, data_version)
+
+    daily_df = snapshot["daily_df"]
+    total_revenue = snapshot["total_revenue"]
+    total_qty = snapshot["total_qty"]
+    avg_per_day = snapshot["avg_per_day"]
 
     if daily_df.empty:
         st.info("Няма продажби за този vendor в избрания период.")
@@ -114,13 +156,11 @@ def main():
     # ===== 2. Детайл по продукти за конкретен ден (drill-down) =====
     st.subheader("🔍 Детайл по продукти за конкретен ден")
 
-    # Вземаме всички налични дати за избрания vendor (извън периода / или само в периода)
-    full_daily_df = get_daily_revenue_df(vendor_id)
-    if full_daily_df.empty:
+    # Всички налични дати за избрания vendor (извън периода / или само в периода)
+    if not snapshot["available_dates"]:
         st.info("Няма никакви продажби за този vendor.")
     else:
-        full_daily_df["date"] = pd.to_datetime(full_daily_df["date"])
-        available_dates = full_daily_df["date"].dt.date.sort_values().unique()
+        available_dates = [pd.to_datetime(d).date() for d in snapshot["available_dates"]]
 
         # Ограничаваме избора само в рамките на периода (по-логично е)
         available_dates_in_period = [d for d in available_dates if start_date <= d <= end_date]
@@ -134,7 +174,7 @@ def main():
         )
         selected_date_str = selected_date.strftime("%Y-%m-%d")
 
-        product_df = get_product_revenue_for_date(vendor_id, selected_date_str)
+        product_df = cached_product_revenue_for_date(vendor_id, selected_date_str, data_version)
         total_revenue_for_day = product_df["revenue"].sum() if not product_df.empty else 0.0
 
         st.markdown(
@@ -152,7 +192,7 @@ def main():
     # ===== 3. TOP продукти за периода (за избрания vendor) =====
     st.subheader("🏆 TOP продукти за избрания vendor и период")
 
-    top_df = get_top_products_for_period(vendor_id, date_from_str, date_to_str, limit=20)
+    top_df = snapshot["top_df"]
     if top_df.empty:
         st.info("Няма продукти с продажби в този период.")
     else:
@@ -164,7 +204,7 @@ def main():
     # ===== 4. Overview за всички вендори (за същия период) =====
     st.subheader("🌍 Оборот по вендори за избрания период")
 
-    all_vendors_df = get_all_vendors_revenue_for_period(date_from_str, date_to_str)
+    all_vendors_df = snapshot["all_vendors_df"]
     if all_vendors_df.empty:
         st.info("Няма продажби за никой vendor в този период.")
     else:
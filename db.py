@@ -1,4 +1,11 @@
+import hashlib
+import io
+import itertools
 import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 from typing import Dict, Any, List
 
 from dotenv import load_dotenv
@@ -9,10 +16,26 @@ from sqlalchemy import (
     String,
     Float,
     Text,
+    Date,
+    DateTime,
+    Index,
     PrimaryKeyConstraint,
+    insert,
+    select,
+    update,
+    delete,
+    func,
+    inspect,
+    text,
+    event,
+    bindparam,
 )
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
+import metrics
+
 # === КОНФИГУРАЦИЯ НА БАЗАТА ===
 
 # Зареждаме .env, за да видим DATABASE_URL локално
@@ -24,12 +47,57 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///data.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Профил на engine-а: "default" (по подразбиране) – настройките на SQLAlchemy/драйвера,
+# "tuned" – настройките по-долу (включва се с DB_PROFILE=tuned, виж bench_db_profiles.py).
+DB_PROFILE = os.getenv("DB_PROFILE", "default")
+
+# SQLite (tuned): WAL – dashboard-ът чете, докато мониторът пише;
+# synchronous=NORMAL е безопасно с WAL; кеш и mmap в байтове/KiB (cache_size < 0 = KiB).
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "10000"))  # ms
+
+# Postgres (tuned): пул и защита от "мъртви" връзки след дълги паузи (cron, daemon)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # сек.
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "60000"))  # ms, 0 = без; не важи за служебните операции
+
 # Допълнителни аргументи за SQLite (check_same_thread)
 connect_args = {}
+engine_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+elif DATABASE_URL.startswith("postgresql") and DB_PROFILE == "tuned":
+    engine_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    if DB_STATEMENT_TIMEOUT and make_url(DATABASE_URL).get_driver_name() in ("psycopg2", "psycopg"):
+        connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **engine_args)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """PRAGMA-ите на tuned профила – за всяка нова SQLite връзка."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    finally:
+        cursor.close()
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+
+if engine.dialect.name == "sqlite" and DB_PROFILE == "tuned":
+    event.listen(engine, "connect", _sqlite_pragmas)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
@@ -57,10 +125,67 @@ class Sale(Base):
     product_id = Column(String, nullable=False)
     product_name = Column(Text, nullable=False)
     timestamp = Column(String, nullable=False)  # 'dd.mm.yyyy/HH:MM'
+    sale_date = Column(Date, nullable=True)       # същият момент като истинска дата
+    sale_at = Column(DateTime, nullable=True)     # ... и като дата+час
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)
     revenue = Column(Float, nullable=False)
 
+    __table_args__ = (
+        Index("ix_sales_vendor_date", "vendor_id", "sale_date"),
+    )
+
+
+SALE_TIMESTAMP_FORMAT = "%d.%m.%Y/%H:%M"
+
+
+def parse_sale_timestamp(timestamp: str):
+    """'dd.mm.yyyy/HH:MM' → datetime; None, ако форматът е счупен."""
+    try:
+        return datetime.strptime(timestamp, SALE_TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+class DailyVendorRevenue(Base):
+    """Rollup: оборот и бройки по (vendor, ден). Поддържа се заедно с sales."""
+    __tablename__ = "daily_vendor_revenue"
+    vendor_id = Column(Integer, nullable=False)
+    sale_date = Column(Date, nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    sales_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("vendor_id", "sale_date", name="pk_daily_vendor_revenue"),
+        Index("ix_daily_vendor_revenue_date", "sale_date"),
+    )
+
+
+class DailyProductRevenue(Base):
+    """Rollup: оборот и бройки по (vendor, продукт, ден)."""
+    __tablename__ = "daily_product_revenue"
+    vendor_id = Column(Integer, nullable=False)
+    product_id = Column(String, nullable=False)
+    sale_date = Column(Date, nullable=False)
+    product_name = Column(Text, nullable=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("vendor_id", "sale_date", "product_id", name="pk_daily_product_revenue"),
+    )
+
+
+ROLLUP_MODELS = (DailyVendorRevenue, DailyProductRevenue)
+
+
+class AppMeta(Base):
+    """Служебни стойности (ключ → число), напр. data_version за кеша на dashboard-а."""
+    __tablename__ = "app_meta"
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
 
 class LastStock(Base):
     __tablename__ = "last_stock"
@@ -74,11 +199,124 @@ class LastStock(Base):
     )
 
 
+class VendorFingerprint(Base):
+    """Хеш на последния записан snapshot (product_id, qty) – за бързо "няма промяна"."""
+    __tablename__ = "vendor_fingerprints"
+    vendor_id = Column(Integer, primary_key=True, autoincrement=False)
+    fingerprint = Column(String(40), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
 # === ИНИЦИАЛИЗАЦИЯ НА БАЗАТА ===
 
+_init_lock = threading.Lock()
+_initialized = False
+
+
 def init_db():
-    """Създава таблиците при първо пускане (ако ги няма)."""
-    Base.metadata.create_all(bind=engine)
+    """
+    Създава таблиците при първо пускане (ако ги няма) и прилага миграциите.
+    Веднъж на процес.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        insp = inspect(engine)
+        rollups_missing = not all(insp.has_table(m.__tablename__) for m in ROLLUP_MODELS)
+
+        Base.metadata.create_all(bind=engine)
+        backfilled = 0
+        # backfill-ът се повтаря, докато не завърши веднъж (напр. след прекъснат рън)
+        if _migrate_sales_dates() or not _get_meta(SALE_DATES_BACKFILLED):
+            backfilled = backfill_sale_dates()
+            _set_meta(SALE_DATES_BACKFILLED, 1)
+        if rollups_missing or backfilled:
+            rebuild_rollups()
+        _initialized = True
+
+
+# Ключ в app_meta: backfill-ът на sale_date/sale_at е минал докрай
+SALE_DATES_BACKFILLED = "sale_dates_backfilled"
+
+
+def _get_meta(key: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(AppMeta.value).where(AppMeta.key == key)).scalar() or 0
+
+
+def _set_meta(key: str, value: int):
+    stmt = _dialect_insert(AppMeta).values(key=key, value=value)
+    stmt = stmt.on_conflict_do_update(index_elements=[AppMeta.key], set_={"value": value})
+    with engine.begin() as conn:
+        conn.execute(stmt)
+
+
+def _migrate_sales_dates() -> bool:
+    """
+    Добавя sale_date/sale_at и индекса (vendor_id, sale_date) към стара таблица sales.
+    Връща True, ако колоните току-що са добавени (трябва backfill).
+    """
+    inspector = inspect(engine)
+    existing = {c["name"] for c in inspector.get_columns("sales")}
+    missing = [c for c in (Sale.__table__.c.sale_date, Sale.__table__.c.sale_at) if c.name not in existing]
+    # CREATE INDEX (дори IF NOT EXISTS) заключва sales на Postgres – само ако индексът липсва
+    has_index = any(ix["name"] == "ix_sales_vendor_date" for ix in inspector.get_indexes("sales"))
+    if not missing and has_index:
+        return False
+
+    with engine.begin() as conn:
+        _without_statement_timeout(conn)
+        for col in missing:
+            col_type = col.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE sales ADD COLUMN {col.name} {col_type}"))
+        if not has_index:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_sales_vendor_date ON sales (vendor_id, sale_date)"
+            ))
+
+    if missing:
+        print(f"🛠️ Миграция: добавени колони {', '.join(c.name for c in missing)} в sales.")
+    return bool(missing)
+
+
+def backfill_sale_dates(batch_size: int = 5000) -> int:
+    """
+    Попълва sale_date/sale_at от текстовия timestamp за редовете, където липсват.
+    Работи на партиди по id (всяка със собствен commit). Връща броя обновени редове.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        session = get_session()
+        try:
+            _without_statement_timeout(session)
+            rows = session.execute(
+                select(Sale.id, Sale.timestamp)
+                .where(Sale.sale_date.is_(None), Sale.id > last_id)
+                .order_by(Sale.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            changes = []
+            for sale_id, timestamp in rows:
+                sale_at = parse_sale_timestamp(timestamp)
+                if sale_at is not None:
+                    changes.append({"id": sale_id, "sale_date": sale_at.date(), "sale_at": sale_at})
+            if changes:
+                session.execute(update(Sale), changes)
+            session.commit()
+
+            updated += len(changes)
+            last_id = rows[-1][0]
+        finally:
+            session.close()
+
+    if updated:
+        print(f"🛠️ Попълнени дати за {updated} продажби.")
+    return updated
 
 
 # === УТИЛИТИ ЗА СЕСИИ ===
@@ -87,26 +325,184 @@ def get_session() -> Session:
     return SessionLocal()
 
 
+def _dialect_insert(model):
+    """INSERT с поддръжка на ON CONFLICT за текущия диалект (Postgres / SQLite)."""
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _without_statement_timeout(conn):
+    """
+    Маха DB_STATEMENT_TIMEOUT за текущата транзакция (Postgres): служебните
+    операции върху цялата история (backfill, rollup-и, преоценка) са бавни по начало.
+    """
+    if engine.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+def _chunks(items: List[Any], size: int = 500):
+    """Разделя списък на парчета (SQLite има лимит за брой параметри)."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# === BULK ЗАПИС (COPY за Postgres, executemany иначе) ===
+
+# От колко реда нагоре Postgres + psycopg2 минава през COPY FROM STDIN
+COPY_THRESHOLD = int(os.getenv("DB_COPY_THRESHOLD", "1000"))
+
+_tmp_counter = itertools.count(1)
+
+
+def _use_copy(rows) -> bool:
+    return (
+        engine.dialect.name == "postgresql"
+        and engine.dialect.driver == "psycopg2"
+        and COPY_THRESHOLD > 0
+        and len(rows) >= COPY_THRESHOLD
+    )
+
+
+def _copy_value(value) -> str:
+    """Стойност във формата на COPY ... (FORMAT text)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, date):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _quote(name: str) -> str:
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def _copy_into(session: Session, table_name: str, columns: List[str], rows: List[Dict[str, Any]]):
+    """COPY table_name (columns) FROM STDIN в текущата транзакция на сесията."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(row.get(c)) for c in columns))
+        buf.write("\n")
+    buf.seek(0)
+
+    cols = ", ".join(_quote(c) for c in columns)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table_name} ({cols}) FROM STDIN", buf)
+    finally:
+        cursor.close()
+
+
+def _bulk_insert(session: Session, model, rows: List[Dict[str, Any]]):
+    """INSERT на много редове (без commit): COPY при Postgres и голям обем, иначе executemany."""
+    if not rows:
+        return
+    if _use_copy(rows):
+        _copy_into(session, model.__tablename__, list(rows[0]), rows)
+    else:
+        session.execute(insert(model), rows)
+
+
+def _bulk_upsert(session: Session, model, rows: List[Dict[str, Any]],
+                 index_elements: List[str], update_columns: List[str]):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE на update_columns (без commit).
+    При Postgres и голям обем: COPY във временна таблица + един INSERT ... SELECT.
+    """
+    if not rows:
+        return
+    if not _use_copy(rows):
+        stmt = _dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={c: stmt.excluded[c] for c in update_columns},
+        )
+        session.execute(stmt, rows)
+        return
+
+    table = model.__tablename__
+    tmp = f"tmp_{table}_{next(_tmp_counter)}"
+    columns = list(rows[0])
+    cols = ", ".join(_quote(c) for c in columns)
+    session.execute(text(f"CREATE TEMP TABLE {tmp} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+    _copy_into(session, tmp, columns, rows)
+    session.execute(text(
+        f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {tmp} "
+        f"ON CONFLICT ({', '.join(_quote(c) for c in index_elements)}) DO UPDATE SET "
+        + ", ".join(f"{_quote(c)} = EXCLUDED.{_quote(c)}" for c in update_columns)
+    ))
+    session.execute(text(f"DROP TABLE {tmp}"))
+
+
 # === ФУНКЦИИ ЗА ЦЕНИ ===
 
-def get_price(vendor_id: int, product_id: str):
-    """Връща цената на даден продукт за даден vendor, ако има такава, иначе None."""
+# Цените на един vendor се зареждат с една заявка в dict {product_id: цена}.
+# В дълго работещ процес картите се пазят до PRICE_CACHE_TTL сек.
+# за най-много PRICE_CACHE_SIZE vendor-а (LRU). TTL=0 изключва кеша.
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "300"))
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "64"))
+
+_price_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_price_cache_lock = threading.Lock()
+
+
+def _load_price_map(session: Session, vendor_id: int) -> Dict[str, float]:
+    result = session.execute(
+        select(ProductPrice.product_id, ProductPrice.unit_price).where(
+            ProductPrice.vendor_id == vendor_id
+        )
+    )
+    return {str(product_id): float(unit_price) for product_id, unit_price in result}
+
+
+def get_price_map(vendor_id: int) -> Dict[str, float]:
+    """
+    Връща {product_id: unit_price} за всички продукти с цена на даден vendor.
+    Речникът идва от кеша – не трябва да се променя от извикващия.
+    """
+    now = time.monotonic()
+    with _price_cache_lock:
+        cached = _price_cache.get(vendor_id)
+        if cached is not None and now - cached[0] < PRICE_CACHE_TTL:
+            _price_cache.move_to_end(vendor_id)
+            return cached[1]
+
     session = get_session()
     try:
-        pp: ProductPrice | None = (
-            session.query(ProductPrice)
-            .filter(
-                ProductPrice.vendor_id == vendor_id,
-                ProductPrice.product_id == product_id,
-            )
-            .one_or_none()
-        )
-        if pp:
-            return float(pp.unit_price)
-        return None
+        prices = _load_price_map(session, vendor_id)
     finally:
         session.close()
 
+    if PRICE_CACHE_TTL > 0:
+        with _price_cache_lock:
+            _price_cache[vendor_id] = (now, prices)
+            _price_cache.move_to_end(vendor_id)
+            while len(_price_cache) > PRICE_CACHE_SIZE:
+                _price_cache.popitem(last=False)
+    return prices
+
+
+def invalidate_price_cache(vendor_id: int = None):
+    """Маха кешираните цени за vendor_id (или за всички, ако е None)."""
+    with _price_cache_lock:
+        if vendor_id is None:
+            _price_cache.clear()
+        else:
+            _price_cache.pop(vendor_id, None)
+
+
+def get_price(vendor_id: int, product_id: str):
+    """Връща цената на даден продукт за даден vendor, ако има такава, иначе None."""
+    return get_price_map(vendor_id).get(str(product_id))
+
 
 def upsert_price(vendor_id: int, product_id: str, product_name: str, unit_price: float):
     """
@@ -134,6 +530,237 @@ def upsert_price(vendor_id: int, product_id: str, product_name: str, unit_price:
             pp.product_name = product_name
             pp.unit_price = unit_price
 
+        _bump_data_version(session)
+        session.commit()
+    finally:
+        session.close()
+
+    invalidate_price_cache(vendor_id)
+
+
+def upsert_prices(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Като upsert_price, но за много цени с една транзакция:
+    rows е списък от dict {"vendor_id", "product_id", "product_name", "unit_price"}
+    (при повтарящ се продукт печели последният ред; product_name=None запазва
+    записаното име). Редове с "insert_only": True (напр. цена по подразбиране
+    при импорт) само добавят липсващи продукти – съществуваща цена не се пипа
+    и се брои като unchanged.
+    Съществуващите цени се четат предварително, за да се пишат само новите
+    и променените (bulk ON CONFLICT DO UPDATE).
+    Връща {"inserted": .., "updated": .., "unchanged": ..}.
+    """
+    wanted: Dict[tuple, Dict[str, Any]] = {}
+    insert_only = set()
+    for r in rows:
+        row = {
+            "vendor_id": int(r["vendor_id"]),
+            "product_id": str(r["product_id"]),
+            "product_name": r.get("product_name"),
+            "unit_price": float(r["unit_price"]),
+        }
+        key = (row["vendor_id"], row["product_id"])
+        wanted[key] = row
+        if r.get("insert_only"):
+            insert_only.add(key)
+        else:
+            insert_only.discard(key)
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    if not wanted:
+        return counts
+
+    session = get_session()
+    try:
+        by_vendor: Dict[int, List[str]] = {}
+        for vendor_id, product_id in wanted:
+            by_vendor.setdefault(vendor_id, []).append(product_id)
+
+        existing = {}
+        for vendor_id, product_ids in by_vendor.items():
+            for chunk in _chunks(product_ids):
+                for product_id, name, price in session.execute(
+                    select(ProductPrice.product_id, ProductPrice.product_name, ProductPrice.unit_price)
+                    .where(ProductPrice.vendor_id == vendor_id, ProductPrice.product_id.in_(chunk))
+                ):
+                    existing[(vendor_id, product_id)] = (name, price)
+
+        # редовете без име не пипат записаното име – сравняват се и се обновяват само по цена
+        named, unnamed, fresh = [], [], []
+        for key, row in wanted.items():
+            old = existing.get(key)
+            has_name = row["product_name"] is not None
+            if key in insert_only:
+                if old is None:
+                    counts["inserted"] += 1
+                    fresh.append(row)
+                else:
+                    counts["unchanged"] += 1
+                continue
+            if old is None:
+                counts["inserted"] += 1
+            elif (old if has_name else old[1]) == (
+                (row["product_name"], row["unit_price"]) if has_name else row["unit_price"]
+            ):
+                counts["unchanged"] += 1
+                continue
+            else:
+                counts["updated"] += 1
+            (named if has_name else unnamed).append(row)
+
+        if named:
+            _bulk_upsert(session, ProductPrice, named,
+                         ["vendor_id", "product_id"], ["product_name", "unit_price"])
+        if unnamed:
+            _bulk_upsert(session, ProductPrice, unnamed, ["vendor_id", "product_id"], ["unit_price"])
+        if fresh:
+            # ON CONFLICT DO NOTHING – ако междувременно някой е добавил истинска цена
+            stmt = _dialect_insert(ProductPrice).on_conflict_do_nothing(
+                index_elements=["vendor_id", "product_id"]
+            )
+            session.execute(stmt, fresh)
+        if named or unnamed or fresh:
+            _bump_data_version(session)
+        session.commit()
+    finally:
+        session.close()
+
+    if counts["inserted"] or counts["updated"]:
+        for vendor_id in by_vendor:
+            invalidate_price_cache(vendor_id)
+    return counts
+
+
+# === ВЕРСИЯ НА ДАННИТЕ (за кешовете на анализите) ===
+
+def _bump_data_version(session: Session):
+    """
+    Увеличава app_meta.data_version (без commit) – в същата транзакция
+    като промяната: нови продажби (през _apply_rollups), цени, rollup-и,
+    преоценки. MAX(sales.id) не става за това: на Postgres id-тата се
+    раздават при INSERT, а не при commit.
+    """
+    stmt = _dialect_insert(AppMeta).values(key="data_version", value=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AppMeta.key],
+        set_={"value": AppMeta.__table__.c.value + 1},
+    )
+    session.execute(stmt)
+
+
+# === ROLLUP ТАБЛИЦИ (дневен оборот) ===
+
+def _apply_rollups(session: Session, sale_rows: List[Dict[str, Any]]):
+    """
+    Добавя току-що вкараните продажби към дневните rollup-и (без commit),
+    с инкрементален upsert – в същата транзакция като INSERT-а в sales,
+    и вдига data_version.
+    """
+    if not sale_rows:
+        return
+    # Ред на заключване при всички писачи: app_meta, после rollup-ите
+    _bump_data_version(session)
+
+    per_vendor: Dict[tuple, Dict[str, Any]] = {}
+    per_product: Dict[tuple, Dict[str, Any]] = {}
+
+    for r in sale_rows:
+        if r.get("sale_date") is None:
+            continue
+        v = per_vendor.setdefault(
+            (r["vendor_id"], r["sale_date"]),
+            {"vendor_id": r["vendor_id"], "sale_date": r["sale_date"],
+             "quantity": 0, "revenue": 0.0, "sales_count": 0},
+        )
+        v["quantity"] += r["quantity"]
+        v["revenue"] += r["revenue"]
+        v["sales_count"] += 1
+
+        p = per_product.setdefault(
+            (r["vendor_id"], r["product_id"], r["sale_date"]),
+            {"vendor_id": r["vendor_id"], "product_id": r["product_id"],
+             "sale_date": r["sale_date"], "product_name": r["product_name"],
+             "quantity": 0, "revenue": 0.0},
+        )
+        p["quantity"] += r["quantity"]
+        p["revenue"] += r["revenue"]
+
+    if per_vendor:
+        t = DailyVendorRevenue.__table__
+        stmt = _dialect_insert(DailyVendorRevenue)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.vendor_id, t.c.sale_date],
+            set_={
+                "quantity": t.c.quantity + stmt.excluded.quantity,
+                "revenue": t.c.revenue + stmt.excluded.revenue,
+                "sales_count": t.c.sales_count + stmt.excluded.sales_count,
+            },
+        )
+        session.execute(stmt, list(per_vendor.values()))
+
+    if per_product:
+        t = DailyProductRevenue.__table__
+        stmt = _dialect_insert(DailyProductRevenue)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.vendor_id, t.c.sale_date, t.c.product_id],
+            set_={
+                "product_name": stmt.excluded.product_name,
+                "quantity": t.c.quantity + stmt.excluded.quantity,
+                "revenue": t.c.revenue + stmt.excluded.revenue,
+            },
+        )
+        session.execute(stmt, list(per_product.values()))
+
+
+def rebuild_rollups(vendor_id: int = None):
+    """
+    Преизчислява rollup таблиците от sales (за един vendor или за всички)
+    с една транзакция: DELETE + INSERT ... SELECT ... GROUP BY.
+    """
+    session = get_session()
+    try:
+        _without_statement_timeout(session)
+        # app_meta преди rollup-ите – същият ред на заключване като _apply_rollups
+        _bump_data_version(session)
+        for model in ROLLUP_MODELS:
+            stmt = delete(model)
+            if vendor_id is not None:
+                stmt = stmt.where(model.vendor_id == vendor_id)
+            session.execute(stmt)
+
+        where = [Sale.sale_date.is_not(None)]
+        if vendor_id is not None:
+            where.append(Sale.vendor_id == vendor_id)
+
+        session.execute(
+            insert(DailyVendorRevenue).from_select(
+                ["vendor_id", "sale_date", "quantity", "revenue", "sales_count"],
+                select(
+                    Sale.vendor_id,
+                    Sale.sale_date,
+                    func.sum(Sale.quantity),
+                    func.sum(Sale.revenue),
+                    func.count(),
+                )
+                .where(*where)
+                .group_by(Sale.vendor_id, Sale.sale_date),
+            )
+        )
+        session.execute(
+            insert(DailyProductRevenue).from_select(
+                ["vendor_id", "product_id", "sale_date", "product_name", "quantity", "revenue"],
+                select(
+                    Sale.vendor_id,
+                    Sale.product_id,
+                    Sale.sale_date,
+                    func.max(Sale.product_name),
+                    func.sum(Sale.quantity),
+                    func.sum(Sale.revenue),
+                )
+                .where(*where)
+                .group_by(Sale.vendor_id, Sale.product_id, Sale.sale_date),
+            )
+        )
         session.commit()
     finally:
         session.close()
@@ -141,6 +768,23 @@ def upsert_price(vendor_id: int, product_id: str, product_name: str, unit_price:
 
 # === ФУНКЦИЯ ЗА ВМЪКВАНЕ НА ПРОДАЖБА ===
 
+def _sale_row(vendor_id: int, product_id: str, product_name: str,
+              timestamp: str, quantity: int, price: float) -> Dict[str, Any]:
+    """Ред за таблица sales (с попълнени sale_date/sale_at и revenue)."""
+    sale_at = parse_sale_timestamp(timestamp)
+    return {
+        "vendor_id": vendor_id,
+        "product_id": str(product_id),
+        "product_name": product_name,
+        "timestamp": timestamp,
+        "sale_date": sale_at.date() if sale_at else None,
+        "sale_at": sale_at,
+        "quantity": int(quantity),
+        "unit_price": price,
+        "revenue": int(quantity) * price,
+    }
+
+
 def insert_sale(vendor_id: int, product_id: str, product_name: str,
                 timestamp: str, quantity: int):
     """
@@ -152,25 +796,139 @@ def insert_sale(vendor_id: int, product_id: str, product_name: str,
     if price is None:
         price = 0.0
 
-    revenue = quantity * price
+    row = _sale_row(vendor_id, product_id, product_name, timestamp, quantity, price)
 
     session = get_session()
     try:
-        sale = Sale(
-            vendor_id=vendor_id,
-            product_id=product_id,
-            product_name=product_name,
-            timestamp=timestamp,
-            quantity=quantity,
-            unit_price=price,
-            revenue=revenue,
-        )
-        session.add(sale)
+        session.execute(insert(Sale), [row])
+        _apply_rollups(session, [row])
         session.commit()
     finally:
         session.close()
 
 
+def get_sales_velocity(days: int = 7) -> Dict[int, float]:
+    """
+    Средно продадени бройки на час за всеки vendor през последните days дни
+    (по daily_vendor_revenue; днешният ден се брои до момента).
+    Вендори без продажби в прозореца липсват в резултата.
+    """
+    now = datetime.now()
+    window_start = (now - timedelta(days=max(1, days) - 1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    hours = max(1.0, (now - window_start).total_seconds() / 3600)
+
+    session = get_session()
+    try:
+        rows = session.execute(
+            select(DailyVendorRevenue.vendor_id, func.sum(DailyVendorRevenue.quantity))
+            .where(DailyVendorRevenue.sale_date >= window_start.date())
+            .group_by(DailyVendorRevenue.vendor_id)
+        ).all()
+        return {int(vendor_id): float(qty or 0) / hours for vendor_id, qty in rows}
+    finally:
+        session.close()
+
+
+# === ПРЕОЦЕНКА НА ПРОДАЖБИ БЕЗ ЦЕНА ===
+
+def _add_rollup_revenue(session: Session, sold: List[Any]):
+    """
+    Добавя разликата в оборота от преоценени продажби към rollup-ите (без commit).
+    sold е списък от (vendor_id, product_id, sale_date, revenue).
+    """
+    per_vendor: Dict[tuple, float] = {}
+    per_product: Dict[tuple, float] = {}
+    for vendor_id, product_id, sale_date, revenue in sold:
+        if sale_date is None or not revenue:
+            continue
+        per_vendor[(vendor_id, sale_date)] = per_vendor.get((vendor_id, sale_date), 0.0) + revenue
+        key = (vendor_id, product_id, sale_date)
+        per_product[key] = per_product.get(key, 0.0) + revenue
+
+    if per_vendor:
+        t = DailyVendorRevenue.__table__
+        session.execute(
+            update(t)
+            .where(t.c.vendor_id == bindparam("b_vendor_id"), t.c.sale_date == bindparam("b_sale_date"))
+            .values(revenue=t.c.revenue + bindparam("b_delta")),
+            [{"b_vendor_id": v, "b_sale_date": d, "b_delta": delta}
+             for (v, d), delta in per_vendor.items()],
+        )
+    if per_product:
+        t = DailyProductRevenue.__table__
+        session.execute(
+            update(t)
+            .where(t.c.vendor_id == bindparam("b_vendor_id"),
+                   t.c.product_id == bindparam("b_product_id"),
+                   t.c.sale_date == bindparam("b_sale_date"))
+            .values(revenue=t.c.revenue + bindparam("b_delta")),
+            [{"b_vendor_id": v, "b_product_id": p, "b_sale_date": d, "b_delta": delta}
+             for (v, p, d), delta in per_product.items()],
+        )
+
+
+def reprice_sales(vendor_id: int = None, batch_size: int = 50000) -> Dict[str, Any]:
+    """
+    Продажбите, записани с unit_price = 0 (нямало е цена), получават цената,
+    която вече има в product_prices, и revenue = quantity * цена.
+
+    Работи на диапазони по id (всеки – своя транзакция): един
+    UPDATE sales ... FROM product_prices ... RETURNING, после същата разлика
+    се добавя към daily_*_revenue и се вдига data_version. Пипат се само
+    редове с unit_price = 0 и цена > 0, така че повторно пускане не прави нищо.
+    Връща {"sales": брой преоценени, "revenue": добавен оборот}.
+    """
+    where = [Sale.unit_price == 0]
+    if vendor_id is not None:
+        where.append(Sale.vendor_id == vendor_id)
+
+    session = get_session()
+    try:
+        _without_statement_timeout(session)
+        low, high = session.execute(select(func.min(Sale.id), func.max(Sale.id)).where(*where)).one()
+    finally:
+        session.close()
+
+    result = {"sales": 0, "revenue": 0.0}
+    if low is None:
+        return result
+
+    price = ProductPrice.__table__
+    for start in range(low, high + 1, batch_size):
+        session = get_session()
+        try:
+            _without_statement_timeout(session)
+            sold = session.execute(
+                update(Sale)
+                .where(
+                    *where,
+                    Sale.id.between(start, start + batch_size - 1),
+                    price.c.vendor_id == Sale.vendor_id,
+                    price.c.product_id == Sale.product_id,
+                    price.c.unit_price > 0,
+                )
+                .values(unit_price=price.c.unit_price, revenue=Sale.quantity * price.c.unit_price)
+                .returning(Sale.vendor_id, Sale.product_id, Sale.sale_date, Sale.revenue)
+            ).all()
+            if sold:
+                # app_meta преди rollup-ите – в същия ред като _apply_rollups,
+                # иначе на Postgres двете транзакции могат да се блокират взаимно
+                _bump_data_version(session)
+                _add_rollup_revenue(session, sold)
+            session.commit()
+        finally:
+            session.close()
+
+        result["sales"] += len(sold)
+        result["revenue"] += sum(r[3] for r in sold)
+
+    if result["sales"]:
+        print(f"💶 Преоценени {result['sales']} продажби без цена (+{result['revenue']:.2f} лв. оборот).")
+    return result
+
+
 # === ФУНКЦИИ ЗА LAST_STOCK (състояние на наличностите) ===
 
 def get_last_inventory_for_vendor(vendor_id: int) -> Dict[str, Dict[str, Any]]:
@@ -186,6 +944,7 @@ def get_last_inventory_for_vendor(vendor_id: int) -> Dict[str, Dict[str, Any]]:
             .all()
         )
 
+        metrics.add("stock_rows_read", len(rows))
         inventory: Dict[str, Dict[str, Any]] = {}
         for r in rows:
             inventory[str(r.product_id)] = {
@@ -197,6 +956,79 @@ def get_last_inventory_for_vendor(vendor_id: int) -> Dict[str, Dict[str, Any]]:
         session.close()
 
 
+def _inventory_rows(vendor_id: int, inventory: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "vendor_id": vendor_id,
+            "product_id": str(product_id),
+            "product_name": data.get("name", ""),
+            "qty": int(data.get("qty", 0)),
+        }
+        for product_id, data in inventory.items()
+    ]
+
+
+def _replace_inventory(session: Session, vendor_id: int, inventory: Dict[str, Dict[str, Any]]):
+    """Трие старото състояние и вкарва новото с един bulk INSERT (без commit)."""
+    session.execute(delete(LastStock).where(LastStock.vendor_id == vendor_id))
+
+    rows = _inventory_rows(vendor_id, inventory)
+    _bulk_insert(session, LastStock, rows)
+    metrics.add("stock_rows_written", len(rows))
+    return len(rows)
+
+
+def _apply_inventory_diff(session: Session, vendor_id: int,
+                          previous: Dict[str, Dict[str, Any]],
+                          current: Dict[str, Dict[str, Any]]):
+    """
+    Записва само разликите между previous и current (без commit):
+    - нови продукти и променени qty/име → един bulk upsert (ON CONFLICT DO UPDATE);
+    - изчезнали продукти → DELETE (current трябва да е пълен snapshot –
+      monitor.run_for_vendor отказва подозрително намалели).
+    Връща (брой upsert-нати, брой изтрити).
+    """
+    changed = {
+        product_id: data
+        for product_id, data in current.items()
+        if product_id not in previous
+        or previous[product_id]["qty"] != int(data.get("qty", 0))
+        or previous[product_id]["name"] != data.get("name", "")
+    }
+    removed = [product_id for product_id in previous if product_id not in current]
+
+    rows = _inventory_rows(vendor_id, changed)
+    _bulk_upsert(session, LastStock, rows, ["vendor_id", "product_id"], ["product_name", "qty"])
+
+    for chunk in _chunks(removed):
+        session.execute(
+            delete(LastStock).where(
+                LastStock.vendor_id == vendor_id,
+                LastStock.product_id.in_(chunk),
+            )
+        )
+
+    metrics.add("stock_rows_written", len(rows) + len(removed))
+    return len(rows), len(removed)
+
+
+def update_inventory_for_vendor(vendor_id: int,
+                                previous: Dict[str, Dict[str, Any]],
+                                current: Dict[str, Dict[str, Any]]):
+    """
+    Като replace_inventory_for_vendor, но пише само разликите спрямо previous
+    (предишното състояние, прочетено с get_last_inventory_for_vendor).
+    """
+    session = get_session()
+    try:
+        result = _apply_inventory_diff(session, vendor_id, previous, current)
+        _save_fingerprint(session, vendor_id, inventory_fingerprint(current))
+        session.commit()
+        return result
+    finally:
+        session.close()
+
+
 def replace_inventory_for_vendor(vendor_id: int, inventory: Dict[str, Dict[str, Any]]):
     """
     Изтрива старото състояние за vendor_id и вкарва новото
@@ -205,25 +1037,147 @@ def replace_inventory_for_vendor(vendor_id: int, inventory: Dict[str, Dict[str,
     """
     session = get_session()
     try:
-        # Трием старите записи за този vendor
-        session.query(LastStock).filter(LastStock.vendor_id == vendor_id).delete()
-
-        # Вмъкваме новите
-        objs = []
-        for product_id, data in inventory.items():
-            objs.append(
-                LastStock(
-                    vendor_id=vendor_id,
-                    product_id=str(product_id),
-                    product_name=data.get("name", ""),
-                    qty=int(data.get("qty", 0)),
-                )
-            )
+        _replace_inventory(session, vendor_id, inventory)
+        _save_fingerprint(session, vendor_id, inventory_fingerprint(inventory))
+        session.commit()
+    finally:
+        session.close()
+
+
+# === ОТПЕЧАТЪК НА НАЛИЧНОСТИТЕ ===
 
-        if objs:
-            session.add_all(objs)
+def inventory_fingerprint(inventory: Dict[str, Dict[str, Any]]) -> str:
+    """SHA-1 на сортираните двойки (product_id, qty) – не зависи от реда и имената."""
+    digest = hashlib.sha1()
+    for product_id in sorted(inventory):
+        digest.update(f"{product_id}:{int(inventory[product_id].get('qty', 0))}\n".encode())
+    return digest.hexdigest()
 
+
+def get_inventory_fingerprint(vendor_id: int):
+    """Последният записан отпечатък за vendor_id (или None)."""
+    session = get_session()
+    try:
+        return session.execute(
+            select(VendorFingerprint.fingerprint).where(VendorFingerprint.vendor_id == vendor_id)
+        ).scalar()
+    finally:
+        session.close()
+
+
+def _save_fingerprint(session: Session, vendor_id: int, fingerprint: str):
+    """Upsert на отпечатъка (без commit) – в същата транзакция като last_stock."""
+    stmt = _dialect_insert(VendorFingerprint).values(
+        vendor_id=vendor_id, fingerprint=fingerprint, updated_at=datetime.now()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[VendorFingerprint.vendor_id],
+        set_={"fingerprint": stmt.excluded.fingerprint, "updated_at": stmt.excluded.updated_at},
+    )
+    session.execute(stmt)
+
+
+# === ЗАПИС НА ЦЯЛ РЪН (продажби + snapshot) В ЕДНА ТРАНЗАКЦИЯ ===
+
+def _sale_rows_for_run(vendor_id: int, sales: List[Dict[str, Any]]):
+    """Цените (от кеша) и готовите редове за sales за един рън → (prices, rows)."""
+    price_map = get_price_map(vendor_id) if sales else {}
+    prices: Dict[str, Any] = {
+        str(s["product_id"]): price_map.get(str(s["product_id"])) for s in sales
+    }
+    rows = [
+        _sale_row(
+            vendor_id,
+            s["product_id"],
+            s["product_name"],
+            s["timestamp"],
+            s["quantity"],
+            prices[str(s["product_id"])] or 0.0,
+        )
+        for s in sales
+    ]
+    return prices, rows
+
+
+def _write_snapshot(session: Session, vendor_id: int,
+                    new_inventory: Dict[str, Dict[str, Any]],
+                    previous_inventory: Dict[str, Dict[str, Any]] = None,
+                    fingerprint: str = None):
+    """last_stock (разлики или цял snapshot) + отпечатъкът му, без commit. Връща записаните редове."""
+    if previous_inventory is None:
+        written = _replace_inventory(session, vendor_id, new_inventory)
+    else:
+        written = sum(_apply_inventory_diff(session, vendor_id, previous_inventory, new_inventory))
+    _save_fingerprint(session, vendor_id, fingerprint or inventory_fingerprint(new_inventory))
+    return written
+
+
+def record_run(vendor_id: int, sales: List[Dict[str, Any]],
+               new_inventory: Dict[str, Dict[str, Any]],
+               previous_inventory: Dict[str, Dict[str, Any]] = None,
+               fingerprint: str = None) -> Dict[str, Any]:
+    """
+    Записва резултата от един рън за vendor_id с една сесия и един commit:
+    - всички продажби с един bulk INSERT (+ дневните rollup-и);
+    - новия snapshot в last_stock – ако е подадено previous_inventory,
+      се пишат само разликите, иначе целият snapshot се подменя;
+    - отпечатъка на snapshot-а (fingerprint или изчислен от new_inventory).
+    sales е списък от dict {"product_id", "product_name", "timestamp", "quantity"}.
+    Цените идват от get_price_map (кеша).
+    Връща {product_id: цена или None} за продадените продукти
+    (None = няма цена, записано е 0.0).
+    """
+    prices, rows = _sale_rows_for_run(vendor_id, sales)
+
+    session = get_session()
+    try:
+        if rows:
+            _bulk_insert(session, Sale, rows)
+            _apply_rollups(session, rows)
+        metrics.add("sale_rows_written", len(rows))
+
+        _write_snapshot(session, vendor_id, new_inventory, previous_inventory, fingerprint)
+        session.commit()
+        return prices
+    finally:
+        session.close()
+
+
+def record_runs(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Като record_run, но за няколко ръна (и различни вендори) в една транзакция:
+    продажбите на всички – с един bulk INSERT и едно обновяване на rollup-ите.
+    runs е списък от dict с ключове vendor_id, sales, new_inventory
+    и по избор previous_inventory, fingerprint (като аргументите на record_run).
+    Един vendor трябва да присъства най-много веднъж.
+    Връща по един dict за всеки рън, в реда на runs:
+    {"prices": {product_id: цена или None}, "sale_rows_written": .., "stock_rows_written": ..}
+    – броячите се връщат, защото DbWriter вика това от своя нишка
+    (извън metrics на вендора) и викащият ги добавя сам.
+    """
+    results = []
+    all_rows = []
+    for run in runs:
+        prices, rows = _sale_rows_for_run(run["vendor_id"], run.get("sales") or [])
+        results.append({"prices": prices, "sale_rows_written": len(rows), "stock_rows_written": 0})
+        all_rows.extend(rows)
+
+    session = get_session()
+    try:
+        if all_rows:
+            _bulk_insert(session, Sale, all_rows)
+            _apply_rollups(session, all_rows)
+
+        for run, result in zip(runs, results):
+            result["stock_rows_written"] = _write_snapshot(
+                session,
+                run["vendor_id"],
+                run["new_inventory"],
+                run.get("previous_inventory"),
+                run.get("fingerprint"),
+            )
         session.commit()
+        return results
     finally:
         session.close()
 
@@ -0,0 +1,167 @@
+"""
+Единствен писател в базата за паралелния мониторинг.
+
+Нишките, които теглят от BigArena, не пишат сами – подават резултата от рън
+(продажби + snapshot) на DbWriter през опашка. Писателят ги групира в
+транзакции (db.record_runs) по брой или по време, така че:
+- SQLite има един писател (без "database is locked");
+- Postgres вижда една връзка вместо по една на нишка.
+
+Опашката е ограничена – ако базата изостава, submit() блокира (backpressure).
+
+    with DbWriter() as writer:
+        run_for_vendor(..., writer=writer)   # чака commit-а на своя рън
+    # тук всичко е записано (close() изчаква опашката)
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import db
+
+# Най-много толкова ръна в една транзакция
+BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH", "20"))
+# ... или толкова секунди след първия чакащ рън
+BATCH_INTERVAL = float(os.getenv("DB_WRITER_INTERVAL", "0.1"))
+# Размер на опашката (след това submit() чака)
+QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE", "50"))
+# Колко секунди викащият чака записа на свой рън, преди да се откаже
+WRITE_TIMEOUT = float(os.getenv("DB_WRITER_TIMEOUT", "300"))
+
+_STOP = object()
+
+
+class DbWriter:
+    """Нишка, която записва рънове на партиди; безопасна за ползване от много нишки."""
+
+    def __init__(self, batch_size: int = None, interval: float = None, queue_size: int = None):
+        self.batch_size = max(1, batch_size or BATCH_SIZE)
+        self.interval = BATCH_INTERVAL if interval is None else interval
+        self.queue = queue.Queue(maxsize=queue_size or QUEUE_SIZE)
+        self.errors = []  # (vendor_id, грешка) за неуспешно записаните рънове
+        self.stats = {"runs": 0, "batches": 0, "seconds": 0.0}
+
+        self._pending = {}  # vendor_id → брой незаписани рънове
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+        self._thread.start()
+
+    # --- API за нишките, които теглят ---
+
+    def submit(self, vendor_id: int, sales, new_inventory, previous_inventory=None,
+               fingerprint: str = None) -> Future:
+        """
+        Слага рън в опашката (аргументите са като на db.record_run).
+        Връща Future с резултата на рън-а от db.record_runs (цени и броячи) след commit-а.
+        """
+        if self._closed:
+            raise RuntimeError("DbWriter е затворен.")
+        if not self._thread.is_alive():
+            raise RuntimeError("Нишката на DbWriter е спряла – записът е невъзможен.")
+        future = Future()
+        run = {
+            "vendor_id": vendor_id,
+            "sales": sales,
+            "new_inventory": new_inventory,
+            "previous_inventory": previous_inventory,
+            "fingerprint": fingerprint,
+        }
+        with self._cond:
+            self._pending[vendor_id] = self._pending.get(vendor_id, 0) + 1
+        self.queue.put((run, future))
+        return future
+
+    def wait_for_vendor(self, vendor_id: int, timeout: float = None) -> bool:
+        """Изчаква записа на чакащите рънове на vendor-а (преди да се чете last_stock)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending.get(vendor_id), timeout)
+
+    def pop_errors(self, vendor_id: int):
+        """Връща и забравя грешките при запис за vendor-а (за дълго работещия daemon)."""
+        with self._cond:
+            mine = [error for v, error in self.errors if v == vendor_id]
+            self.errors = [(v, error) for v, error in self.errors if v != vendor_id]
+        return mine
+
+    def close(self):
+        """Записва всичко останало в опашката и спира нишката."""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join()
+        if self.stats["runs"]:
+            print(
+                f"💾 DB writer: {self.stats['runs']} ръна в {self.stats['batches']} транзакции "
+                f"({self.stats['seconds']:.2f} сек.)"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- нишката на писателя ---
+
+    def _next_batch(self):
+        """Чака първи рън, после добира до batch_size или до изтичане на interval."""
+        item = self.queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            results = db.record_runs([run for run, _ in batch])
+            outcomes = [(future, result, None) for (_, future), result in zip(batch, results)]
+        except Exception as e:
+            if len(batch) == 1:
+                outcomes = [(batch[0][1], None, e)]
+            else:
+                # една лоша партида не трябва да губи останалите – пишем ги поотделно
+                print(f"⚠️ DB writer: партидата от {len(batch)} ръна се провали ({e}), пиша поотделно.")
+                outcomes = []
+                for run, future in batch:
+                    try:
+                        outcomes.append((future, db.record_runs([run])[0], None))
+                    except Exception as single_error:
+                        outcomes.append((future, None, single_error))
+
+        self.stats["batches"] += 1
+        self.stats["runs"] += len(batch)
+        self.stats["seconds"] += time.perf_counter() - started
+
+        for (run, _), (future, result, error) in zip(batch, outcomes):
+            if error is not None:
+                print(f"❌ DB writer: vendor {run['vendor_id']}: {type(error).__name__}: {error}")
+                with self._cond:
+                    self.errors.append((run["vendor_id"], f"{type(error).__name__}: {error}"))
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            with self._cond:
+                self._pending[run["vendor_id"]] -= 1
+                self._cond.notify_all()
+
+    def _loop(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
@@ -0,0 +1,284 @@
+"""
+Локален заместител на my.bigarena.net за тестове и бенчмаркове.
+
+Обслужва:
+- GET  /login                – страница с CSRF токен (meta tag) и XSRF-TOKEN бисквитка;
+- POST /login                – "вход" (проверява _token) и dashboard с нов CSRF токен;
+- POST /orders/get-products  – DataTables JSON (draw/start/length/vendor_id),
+                               419 при липсваща/изтекла сесия или грешен X-CSRF-TOKEN.
+
+Каталозите са синтетични и детерминирани (seed); tick() симулира продажби.
+Пускане като fixture:
+
+    with running_server(vendors=[1001, 1002], products=500) as server:
+        os.environ["BIGARENA_BASE_URL"] = server.base_url
+        ...
+
+или самостоятелно: python fake_bigarena.py --vendors 3 --products 2000 --tick-every 60
+"""
+import argparse
+import html
+import json
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PAGE_HTML = """<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<meta name="csrf-token" content="{token}">
+<title>{title}</title>
+</head><body>
+<form method="POST" action="/login"><input type="hidden" name="_token" value="{token}"></form>
+</body></html>"""
+
+
+class FakeCatalog:
+    """Синтетични продукти по vendor с варианти и наличности."""
+
+    def __init__(self, vendor_ids, products: int = 500, variants: int = 3,
+                 sales_per_tick: int = 20, seed: int = 42):
+        self.rng = random.Random(seed)
+        self.sales_per_tick = sales_per_tick
+        self.lock = threading.Lock()
+        self.products = {}
+        for vendor_id in vendor_ids:
+            self.products[vendor_id] = [
+                self._make_product(vendor_id, i, variants) for i in range(products)
+            ]
+
+    def _make_product(self, vendor_id: int, i: int, variants: int) -> dict:
+        title = f"Продукт {vendor_id}-{i} \"Модел {self.rng.randint(100, 999)}\""
+        name_html = (
+            '<div class="item-data"><img src="/img/p.jpg" class="item-data-img">'
+            f'<span class="item-data-title">{title}</span>'
+            f'<span class="item-data-sku">SKU-{vendor_id}-{i}</span></div>'
+        )
+        return {
+            "id": vendor_id * 100000 + i,
+            "name": html.escape(name_html),
+            "sku": f"SKU-{vendor_id}-{i}",
+            "price": f"{self.rng.uniform(5, 150):.2f}",
+            "status": "active",
+            "image": f"https://cdn.example.invalid/{vendor_id}/{i}.jpg",
+            "variants": [
+                {
+                    "id": (vendor_id * 100000 + i) * 10 + v,
+                    "sku": f"SKU-{vendor_id}-{i}-{v}",
+                    "attributes": {"size": ["S", "M", "L", "XL"][v % 4], "color": "black"},
+                    "on_hand_quantity": self.rng.randint(0, 40),
+                    "reserved_quantity": 0,
+                    "barcode": f"38000{vendor_id}{i:05d}{v}",
+                }
+                for v in range(variants)
+            ],
+        }
+
+    def tick(self, sales: int = None):
+        """Симулира продажби: по `sales` единици от случайни варианти на всеки vendor."""
+        sales = self.sales_per_tick if sales is None else sales
+        with self.lock:
+            for items in self.products.values():
+                for _ in range(sales):
+                    if not items:
+                        break
+                    variant = self.rng.choice(self.rng.choice(items)["variants"])
+                    if variant["on_hand_quantity"] > 0:
+                        variant["on_hand_quantity"] -= 1
+
+    def page(self, vendor_id: int, start: int, length: int):
+        with self.lock:
+            items = self.products.get(vendor_id, [])
+            return len(items), json.loads(json.dumps(items[start:start + length]))
+
+
+class FakeBigArenaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, catalog: FakeCatalog, max_page_length: int = None,
+                 latency: float = 0.0):
+        super().__init__(address, FakeBigArenaHandler)
+        self.catalog = catalog
+        self.max_page_length = max_page_length
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = {}          # session id -> {"csrf": ..., "auth": bool}
+        self.force_419 = 0          # колко следващи API заявки да върнат 419
+        self.fail_next = []         # HTTP статуси за следващите API заявки (напр. 502)
+        self.stats = {"login_get": 0, "login_post": 0, "api": 0, "api_419": 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def expire_sessions(self):
+        """Всички текущи сесии изтичат – следващата API заявка връща 419."""
+        with self.lock:
+            self.sessions.clear()
+
+    def return_419(self, times: int = 1):
+        with self.lock:
+            self.force_419 += times
+
+    def fail_requests(self, *statuses: int):
+        with self.lock:
+            self.fail_next.extend(statuses)
+
+
+class FakeBigArenaHandler(BaseHTTPRequestHandler):
+    server: FakeBigArenaServer
+
+    def log_message(self, format, *args):  # тих режим
+        pass
+
+    # --- помощни ---
+
+    def _cookies(self) -> dict:
+        result = {}
+        for part in self.headers.get("Cookie", "").split(";"):
+            if "=" in part:
+                k, v = part.strip().split("=", 1)
+                result[k] = v
+        return result
+
+    def _form(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        return {k: v[0] for k, v in parse_qs(body, keep_blank_values=True).items()}
+
+    def _send(self, status: int, body: bytes, content_type: str, cookies: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (cookies or {}).items():
+            self.send_header("Set-Cookie", f"{k}={v}; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _new_session(self, auth: bool):
+        sid = secrets.token_hex(16)
+        csrf = secrets.token_hex(20)
+        with self.server.lock:
+            self.server.sessions[sid] = {"csrf": csrf, "auth": auth}
+        return sid, csrf
+
+    # --- маршрути ---
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/login":
+            self._send(404, b"not found", "text/plain")
+            return
+        self.server.stats["login_get"] += 1
+        sid, csrf = self._new_session(auth=False)
+        page = PAGE_HTML.format(token=csrf, title="Login").encode("utf-8")
+        self._send(200, page, "text/html; charset=utf-8",
+                   {"laravel_session": sid, "XSRF-TOKEN": csrf})
+
+    def do_POST(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self.path.split("?")[0]
+        if path == "/login":
+            self._login()
+        elif path == "/orders/get-products":
+            self._get_products()
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _login(self):
+        self.server.stats["login_post"] += 1
+        form = self._form()
+        sid = self._cookies().get("laravel_session")
+        with self.server.lock:
+            sess = self.server.sessions.get(sid)
+        if not sess or form.get("_token") != sess["csrf"]:
+            self._send(419, b"Page Expired", "text/html")
+            return
+        sid, csrf = self._new_session(auth=True)
+        page = PAGE_HTML.format(token=csrf, title="Dashboard").encode("utf-8")
+        self._send(200, page, "text/html; charset=utf-8",
+                   {"laravel_session": sid, "XSRF-TOKEN": csrf})
+
+    def _get_products(self):
+        srv = self.server
+        srv.stats["api"] += 1
+        form = self._form()
+
+        with srv.lock:
+            status = srv.fail_next.pop(0) if srv.fail_next else None
+            forced = srv.force_419 > 0
+            if forced:
+                srv.force_419 -= 1
+            sess = srv.sessions.get(self._cookies().get("laravel_session"))
+
+        if status:
+            self._send(status, b"upstream error", "text/plain")
+            return
+        if forced or not sess or not sess["auth"] or self.headers.get("X-CSRF-TOKEN") != sess["csrf"]:
+            srv.stats["api_419"] += 1
+            self._send(419, b'{"message": "CSRF token mismatch."}', "application/json")
+            return
+
+        start = int(form.get("start", 0))
+        length = int(form.get("length", 10))
+        if srv.max_page_length:
+            length = min(length, srv.max_page_length)
+        total, data = srv.catalog.page(int(form.get("vendor_id", 0)), start, length)
+        body = json.dumps({
+            "draw": int(form.get("draw", 1)),
+            "recordsTotal": total,
+            "recordsFiltered": total,
+            "data": data,
+        }, ensure_ascii=False).encode("utf-8")
+        self._send(200, body, "application/json")
+
+
+@contextmanager
+def running_server(vendors=(1001,), products: int = 500, variants: int = 3,
+                   sales_per_tick: int = 20, seed: int = 42,
+                   max_page_length: int = None, latency: float = 0.0):
+    """Пуска FakeBigArenaServer на свободен порт в отделна нишка."""
+    catalog = FakeCatalog(vendors, products, variants, sales_per_tick, seed)
+    server = FakeBigArenaServer(("127.0.0.1", 0), catalog, max_page_length, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локален fake BigArena сървър.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--vendors", type=int, default=3, help="брой синтетични вендори (ID от 1001)")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--variants", type=int, default=3)
+    parser.add_argument("--sales-per-tick", type=int, default=20)
+    parser.add_argument("--tick-every", type=float, default=0, help="сек. между tick-овете (0 = без)")
+    parser.add_argument("--max-page-length", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vendor_ids = [1001 + i for i in range(args.vendors)]
+    catalog = FakeCatalog(vendor_ids, args.products, args.variants, args.sales_per_tick, args.seed)
+    server = FakeBigArenaServer(("127.0.0.1", args.port), catalog, args.max_page_length)
+    print(f"Fake BigArena на {server.base_url} (vendors: {vendor_ids})")
+
+    if args.tick_every > 0:
+        def _ticker():
+            while True:
+                time.sleep(args.tick_every)
+                catalog.tick()
+        threading.Thread(target=_ticker, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,135 @@
+"""
+Генератор на синтетична история за sales / product_prices / last_stock.
+
+Записите следват реалния формат ('dd.mm.yyyy/HH:MM', снимки на всеки 25 мин.),
+попълват sale_date/sale_at и накрая преизчисляват rollup таблиците.
+Базата е тази от DATABASE_URL (SQLite или локален Postgres).
+
+    DATABASE_URL=sqlite:///bench.db python gen_sales_history.py --rows 1000000 --vendors 10 --days 365
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import db
+
+SNAPSHOT_MINUTES = 25
+
+
+def _insert_chunks(model, rows, chunk_size: int):
+    """Bulk INSERT на парчета (COPY при Postgres), всяко в своя транзакция."""
+    for start in range(0, len(rows), chunk_size):
+        session = db.get_session()
+        try:
+            db._bulk_insert(session, model, rows[start:start + chunk_size])
+            session.commit()
+        finally:
+            session.close()
+
+
+def seed_catalog(vendor_ids, products: int, seed: int = 42, missing_price_ratio: float = 0.1,
+                 chunk_size: int = 5000):
+    """Попълва product_prices и last_stock за вендорите (ако ги няма)."""
+    rng = random.Random(seed)
+    prices, stock = [], []
+    existing = {
+        vid for vid in vendor_ids
+        if db.get_last_inventory_for_vendor(vid)
+    }
+    for vid in vendor_ids:
+        if vid in existing:
+            continue
+        for i in range(products):
+            product_id = str(vid * 100000 + i)
+            name = f"Продукт {vid}-{i}"
+            if rng.random() >= missing_price_ratio:
+                prices.append({
+                    "vendor_id": vid, "product_id": product_id,
+                    "product_name": name, "unit_price": round(rng.uniform(5, 150), 2),
+                })
+            stock.append({
+                "vendor_id": vid, "product_id": product_id,
+                "product_name": name, "qty": rng.randint(0, 120),
+            })
+
+    _insert_chunks(db.ProductPrice, prices, chunk_size)
+    _insert_chunks(db.LastStock, stock, chunk_size)
+    db.invalidate_price_cache()
+
+
+def generate_history(rows: int, vendor_ids, products: int, start: datetime, days: float,
+                     seed: int = 42, chunk_size: int = 10000, rebuild: bool = True) -> datetime:
+    """
+    Вкарва ~rows продажби, разпределени по 25-минутни снимки в [start, start + days).
+    Връща момента след последната снимка (за продължаване на историята).
+    """
+    rng = random.Random(seed ^ int(start.timestamp()))
+    seed_catalog(vendor_ids, products, seed)
+    price_maps = {vid: db.get_price_map(vid) for vid in vendor_ids}
+
+    snapshots = max(1, int(days * 24 * 60 / SNAPSHOT_MINUTES))
+    per_snapshot = rows / (snapshots * len(vendor_ids))
+
+    buffer = []
+    written = 0
+    moment = start
+    for _ in range(snapshots):
+        ts = moment.strftime(db.SALE_TIMESTAMP_FORMAT)
+        for vid in vendor_ids:
+            # Поасоново-подобен брой продажби около средното
+            count = int(per_snapshot) + (1 if rng.random() < per_snapshot % 1 else 0)
+            for _ in range(count):
+                # няколко хита и дълга опашка
+                i = min(products - 1, int(rng.expovariate(8 / products)))
+                product_id = str(vid * 100000 + i)
+                qty = rng.choice((1, 1, 1, 2, 3))
+                price = price_maps[vid].get(product_id, 0.0)
+                buffer.append({
+                    "vendor_id": vid,
+                    "product_id": product_id,
+                    "product_name": f"Продукт {vid}-{i}",
+                    "timestamp": ts,
+                    "sale_date": moment.date(),
+                    "sale_at": moment,
+                    "quantity": qty,
+                    "unit_price": price,
+                    "revenue": qty * price,
+                })
+        if len(buffer) >= chunk_size:
+            _insert_chunks(db.Sale, buffer, chunk_size)
+            written += len(buffer)
+            buffer = []
+        moment += timedelta(minutes=SNAPSHOT_MINUTES)
+
+    if buffer:
+        _insert_chunks(db.Sale, buffer, chunk_size)
+        written += len(buffer)
+
+    if rebuild:
+        db.rebuild_rollups()
+    print(f"🧪 Генерирани {written} продажби ({start:%d.%m.%Y} – {moment:%d.%m.%Y}).")
+    return moment
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетична история на продажбите за бенчмаркове.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="брой продажби")
+    parser.add_argument("--vendors", type=int, default=10, help="брой вендори (ID от 1001)")
+    parser.add_argument("--products", type=int, default=2000, help="продукти на вендор")
+    parser.add_argument("--days", type=float, default=365, help="дни история")
+    parser.add_argument("--start", default=None, help="начална дата YYYY-MM-DD (по подразбиране днес - days)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    db.init_db()
+    start = (
+        datetime.strptime(args.start, "%Y-%m-%d") if args.start
+        else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days)
+    )
+    vendor_ids = [1001 + i for i in range(args.vendors)]
+
+    t0 = time.perf_counter()
+    generate_history(args.rows, vendor_ids, args.products, start, args.days, args.seed, args.chunk_size)
+    print(f"Готово за {time.perf_counter() - t0:.1f} сек.")
@@ -0,0 +1,173 @@
+"""
+Импорт на ценови листи в product_prices (вместо generate_price_inserts.py).
+
+Файлът се чете поточно и се записва на партиди (db.upsert_prices – bulk
+ON CONFLICT DO UPDATE), така че паметта не зависи от размера му.
+Поддържани формати (по разширението или с --format):
+- csv   – колони product_id, unit_price (или price) и по избор vendor_id, product_name (или name);
+- jsonl – по един JSON обект на ред със същите ключове;
+- json  – масив от такива обекти или state файл {product_id: {"name": ..., "price": ...}}.
+
+    python import_prices.py prices.csv --vendor-id 419
+    python import_prices.py airways_inventory_state.json --vendor-id 419 --default-price 0
+    python import_prices.py airways_prices.csv --default-price 0
+
+Празна клетка unit_price означава „без цена“: с --default-price редът
+само добавя нов продукт и не пипа вече въведена цена (airways_prices.csv
+е такъв файл).
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import db
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - зависи от средата
+    ijson = None
+
+CHUNK_SIZE = int(os.getenv("PRICE_IMPORT_CHUNK", "5000"))
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "json"}
+
+
+def _pick(record: dict, *keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def normalize(record: dict, vendor_id: int = None, default_price: float = None):
+    """
+    Запис от файла → ред за db.upsert_prices или None, ако липсват данни.
+    Цена от default_price е само за нови продукти (insert_only) – не
+    презаписва съществуваща цена.
+    """
+    product_id = _pick(record, "product_id", "id")
+    vendor = _pick(record, "vendor_id") or vendor_id
+    price = _pick(record, "unit_price", "price")
+    insert_only = price is None
+    if price is None:
+        price = default_price
+    if product_id is None or vendor is None or price is None:
+        return None
+    try:
+        return {
+            "vendor_id": int(vendor),
+            "product_id": str(product_id).strip(),
+            "product_name": _pick(record, "product_name", "name"),
+            "unit_price": float(str(price).replace(",", ".")),
+            "insert_only": insert_only,
+        }
+    except ValueError:
+        return None
+
+
+def _json_records(path: str):
+    """
+    Обекти от JSON масив или (product_id, обект) от state файл.
+    С ijson файлът се чете поточно; без него – json.load (целият в паметта).
+    JSON е винаги UTF-8 (BOM-ът се прескача).
+    """
+    with open(path, "rb") as f:
+        head = f.read(64)
+        offset = 3 if head.startswith(b"\xef\xbb\xbf") else 0
+        is_array = head[offset:].lstrip().startswith(b"[")
+        f.seek(offset)
+
+        if ijson is not None:
+            if is_array:
+                yield from ijson.items(f, "item", use_float=True)
+                return
+            pairs = ijson.kvitems(f, "", use_float=True)
+        else:
+            data = json.loads(f.read().decode("utf-8"))
+            if is_array:
+                yield from data
+                return
+            pairs = data.items()
+
+        for product_id, info in pairs:
+            info = dict(info) if isinstance(info, dict) else {"unit_price": info}
+            info.setdefault("product_id", product_id)
+            yield info
+
+
+def iter_records(path: str, fmt: str, encoding: str = "utf-8-sig"):
+    """Суровите записи (dict) от файла, един по един."""
+    if fmt == "json":
+        yield from _json_records(path)
+        return
+
+    with open(path, "r", encoding=encoding, newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def import_prices(path: str, fmt: str = None, vendor_id: int = None,
+                  default_price: float = None, chunk_size: int = None,
+                  encoding: str = "utf-8-sig") -> dict:
+    """Импортира файла на партиди; връща броячите (inserted/updated/unchanged/skipped)."""
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt not in ("csv", "jsonl", "json"):
+        raise ValueError(f"Неизвестен формат за {path} – посочи --format csv|jsonl|json.")
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    records = iter_records(path, fmt, encoding)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        rows = []
+        for record in chunk:
+            row = normalize(record, vendor_id, default_price)
+            if row is None:
+                totals["skipped"] += 1
+            else:
+                rows.append(row)
+        for key, n in db.upsert_prices(rows).items():
+            totals[key] += n
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт на цени (CSV / JSON lines / JSON) в product_prices.")
+    parser.add_argument("path", help="файл с цени")
+    parser.add_argument("--format", choices=("csv", "jsonl", "json"), default=None,
+                        help="по подразбиране – според разширението")
+    parser.add_argument("--vendor-id", type=int, default=None,
+                        help="vendor_id за редовете, които нямат своя колона vendor_id")
+    parser.add_argument("--default-price", type=float, default=None,
+                        help="цена за редовете без цена (напр. 0 за state файл) – само за нови продукти, "
+                             "съществуващите цени не се пипат; иначе редовете се пропускат")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--encoding", default="utf-8-sig", help="кодировка на CSV/JSONL (JSON е винаги UTF-8)")
+    args = parser.parse_args()
+
+    db.init_db()
+    started = time.perf_counter()
+    try:
+        totals = import_prices(args.path, args.format, args.vendor_id,
+                               args.default_price, args.chunk_size, args.encoding)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(
+        f"📥 Цени от {args.path}: нови {totals['inserted']}, променени {totals['updated']}, "
+        f"без промяна {totals['unchanged']}, пропуснати {totals['skipped']} "
+        f"({time.perf_counter() - started:.1f} сек.)"
+    )
@@ -0,0 +1,54 @@
+import argparse
+
+import db
+
+
+def cmd_migrate(args):
+    """Създава/мигрира схемата и попълва липсващите дати в sales."""
+    db.init_db()
+    updated = db.backfill_sale_dates(batch_size=args.batch_size)
+    if updated:
+        # новите дати трябва да влязат и в rollup-ите
+        db.rebuild_rollups()
+    print(f"✅ Схемата е готова. Допълнително попълнени дати: {updated}")
+
+
+def cmd_rebuild_rollups(args):
+    """Преизчислява дневните rollup таблици от историята в sales."""
+    db.init_db()
+    db.rebuild_rollups(vendor_id=args.vendor_id)
+    target = f"vendor {args.vendor_id}" if args.vendor_id is not None else "всички vendor-и"
+    print(f"✅ Rollup таблиците са преизчислени за {target}.")
+
+
+def cmd_reprice(args):
+    """Дава цена на продажбите, записани с 0, ако вече има цена в product_prices."""
+    db.init_db()
+    result = db.reprice_sales(vendor_id=args.vendor_id, batch_size=args.batch_size)
+    if not result["sales"]:
+        print("✅ Няма продажби без цена, за които вече има цена.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Помощни команди за базата на монитора.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="схема + backfill на sale_date/sale_at")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("rebuild-rollups", help="преизчислява daily_*_revenue от sales")
+    p.add_argument("--vendor-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("reprice", help="преоценява продажбите с unit_price=0 по текущите цени")
+    p.add_argument("--vendor-id", type=int, default=None)
+    p.add_argument("--batch-size", type=int, default=50000, help="диапазон от id-та на транзакция")
+    p.set_defaults(func=cmd_reprice)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Къде да се пишат метриките от всеки рън (JSON lines, по един ред на вендор)
+METRICS_FILE = os.getenv("METRICS_FILE", "run_metrics.jsonl")
+# По избор: Prometheus textfile (за node_exporter textfile collector)
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "")
+
+# Етапите в реда, в който ги показваме в обобщението
+STAGES = (
+    "login",
+    "http_fetch",
+    "json_parse",
+    "process_inventory",
+    "diff",
+    "db_read",
+    "db_write",
+)
+
+_local = threading.local()
+
+
+class RunMetrics:
+    """
+    Тайминги по етапи и броячи за един вендор (или за глобалния login).
+    Времената са "собствени": ако етап се изпълнява вътре в друг
+    (напр. http_fetch по време на process_inventory при стрийминга),
+    времето му се вади от родителя, за да не се брои два пъти.
+    """
+
+    def __init__(self, name: str, vendor_id: int = None):
+        self.name = name
+        self.vendor_id = vendor_id
+        self.ok = None
+        self.error = None
+        self.wall = 0.0
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._stacks = {}
+
+    def add(self, counter: str, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = self._stacks.setdefault(threading.get_ident(), [])
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed - frame[2]
+
+    def to_dict(self) -> dict:
+        d = {
+            "vendor": self.name,
+            "vendor_id": self.vendor_id,
+            "ok": self.ok,
+            "wall_s": round(self.wall, 4),
+            "stages": {k: round(v, 4) for k, v in self.timings.items()},
+            "counters": dict(self.counters),
+        }
+        if self.error:
+            d["error"] = self.error
+        return d
+
+
+def current():
+    """Активният RunMetrics за текущата нишка (или None)."""
+    return getattr(_local, "current", None)
+
+
+@contextmanager
+def collect(name: str, vendor_id: int = None):
+    """
+    Активира RunMetrics за текущата нишка; всички metrics.stage/add
+    отдолу (monitor, db, bigarena_client) пишат в него.
+    """
+    m = RunMetrics(name, vendor_id)
+    previous = current()
+    _local.current = m
+    started = time.perf_counter()
+    try:
+        yield m
+    finally:
+        m.wall += time.perf_counter() - started
+        _local.current = previous
+
+
+@contextmanager
+def stage(name: str):
+    """Мери етап в активния RunMetrics; без активен – нищо не прави."""
+    m = current()
+    if m is None:
+        yield
+        return
+    with m.stage(name):
+        yield
+
+
+def add(counter: str, n=1):
+    """Увеличава брояч в активния RunMetrics (ако има)."""
+    m = current()
+    if m is not None:
+        m.add(counter, n)
+
+
+def bind(fn):
+    """Обвива fn така, че да пише в активния RunMetrics и от друга нишка (thread pool)."""
+    m = current()
+    if m is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        previous = current()
+        _local.current = m
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.current = previous
+
+    return wrapper
+
+
+# === ЕКСПОРТ ===
+
+def write_jsonl(records, path: str = None, run_id: str = None):
+    """Добавя по един JSON ред на запис (RunMetrics.to_dict()) към path."""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    run_id = run_id or datetime.now().strftime("%Y%m%dT%H%M%S")
+    with open(path, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps({"run_id": run_id, **r}, ensure_ascii=False) + "\n")
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def write_prometheus(records, path: str = None):
+    """Презаписва Prometheus textfile с метриките от последния рън."""
+    path = path or METRICS_PROM_FILE
+    if not path:
+        return
+
+    lines = [
+        "# HELP bigarena_monitor_stage_seconds Time spent per stage in the last run.",
+        "# TYPE bigarena_monitor_stage_seconds gauge",
+    ]
+    for r in records:
+        for name, seconds in r["stages"].items():
+            lines.append(
+                f'bigarena_monitor_stage_seconds{{vendor="{_label(r["vendor"])}",stage="{name}"}} {seconds}'
+            )
+    lines += [
+        "# HELP bigarena_monitor_count Counters (bytes, products, sales, rows) from the last run.",
+        "# TYPE bigarena_monitor_count gauge",
+    ]
+    for r in records:
+        for name, value in r["counters"].items():
+            lines.append(
+                f'bigarena_monitor_count{{vendor="{_label(r["vendor"])}",name="{name}"}} {value}'
+            )
+    lines += [
+        "# HELP bigarena_monitor_vendor_ok 1 if the vendor run succeeded.",
+        "# TYPE bigarena_monitor_vendor_ok gauge",
+    ]
+    for r in records:
+        if r["ok"] is not None:
+            lines.append(f'bigarena_monitor_vendor_ok{{vendor="{_label(r["vendor"])}"}} {int(bool(r["ok"]))}')
+    lines += [
+        "# HELP bigarena_monitor_wall_seconds Wall time per vendor in the last run.",
+        "# TYPE bigarena_monitor_wall_seconds gauge",
+    ]
+    for r in records:
+        lines.append(f'bigarena_monitor_wall_seconds{{vendor="{_label(r["vendor"])}"}} {r["wall_s"]}')
+    lines += [
+        "# TYPE bigarena_monitor_last_run_timestamp_seconds gauge",
+        f"bigarena_monitor_last_run_timestamp_seconds {int(time.time())}",
+    ]
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def print_summary(records):
+    """Печата обобщаваща таблица (секунди по етапи + основни броячи)."""
+    stages = [s for s in STAGES if any(s in r["stages"] for r in records)]
+    header = ["vendor", "ok", "wall"] + stages + ["KB", "products", "sales"]
+    rows = []
+    for r in records:
+        ok = "-" if r["ok"] is None else ("✅" if r["ok"] else "❌")
+        rows.append(
+            [str(r["vendor"]), ok, f'{r["wall_s"]:.2f}']
+            + [f'{r["stages"].get(s, 0.0):.2f}' for s in stages]
+            + [
+                f'{r["counters"].get("bytes_received", 0) / 1024:.0f}',
+                str(r["counters"].get("products", 0)),
+                str(r["counters"].get("sales", 0)),
+            ]
+        )
+
+    widths = [max(len(h), *(len(row[i]) for row in rows)) if rows else len(h) for i, h in enumerate(header)]
+    print("\n=== Метрики (сек.) ===")
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)))
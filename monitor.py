@@ -1,21 +1,47 @@
 import html
+import os
 import re
 from datetime import datetime
+from functools import lru_cache
 
-from bigarena_client import login, get_products_for_vendor
+from bigarena_client import (
+    ensure_logged_in,
+    iter_products_for_vendor,
+    FetchError,
+)
 import db
+import metrics
+from db_writer import WRITE_TIMEOUT
 
 
+# Ако между два ръна "изчезнат" повече от този дял от продуктите, каталогът се
+# тегли още веднъж: същият по-малък каталог се приема (истинско изтегляне на
+# продукти), различен – рънът е неуспешен и нищо не се записва.
+# Проверката важи само за каталози с поне STOCK_GUARD_MIN_PRODUCTS продукта.
+STOCK_MAX_REMOVED_RATIO = float(os.getenv("STOCK_MAX_REMOVED_RATIO", "0.5"))
+STOCK_GUARD_MIN_PRODUCTS = int(os.getenv("STOCK_GUARD_MIN_PRODUCTS", "20"))
+
+
+# === ИМЕНА НА ПРОДУКТИ ===
+
+# Колко сурови HTML имена да помним (имената почти не се менят между рънове)
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "50000"))
+
+_TITLE_RE = re.compile(r'class="item-data-title">([^<]+)<')
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def clean_product_name(raw_html_name: str) -> str:
-    """Изчиства HTML името до чист текст."""
+    """Изчиства HTML името до чист текст (кешира се по суровия HTML)."""
     if not raw_html_name:
         return "Unknown Product"
     decoded_html = html.unescape(raw_html_name)
-    match = re.search(r'class="item-data-title">([^<]+)<', decoded_html)
+    match = _TITLE_RE.search(decoded_html)
     if match:
         return match.group(1).strip()
     # fallback – махаме всички тагове
-    return re.sub(r"<[^>]+>", "", decoded_html).strip()
+    return _TAG_RE.sub("", decoded_html).strip()
 
 
 def process_inventory(products_list):
@@ -39,17 +65,107 @@ def process_inventory(products_list):
         }
         total_stock += qty
 
+    metrics.add("products", len(inventory))
     return inventory, total_stock
 
 
+def _stream_inventory(vendor_id: int):
+    with metrics.stage("process_inventory"):
+        return process_inventory(iter_products_for_vendor(vendor_id))
+
+
+def fetch_inventory(vendor_id: int):
+    """
+    Стриймва продуктите на vendor-а към process_inventory.
+    Връща (inventory_dict, total_stock) или None при грешка.
+    Изтеклата сесия (419) и временните грешки се обработват в bigarena_client.
+    """
+    try:
+        return _stream_inventory(vendor_id)
+    except FetchError as e:
+        print(f"ГРЕШКА: {e}")
+        return None
+
+
+def diff_inventory(vendor_id: int, previous_inventory, current_inventory, timestamp: str):
+    """
+    Сравнява текущите наличности с предишните.
+    Връща (sales, sales_details, total_sales_count):
+    - sales: dict-ове за db.record_run;
+    - sales_details: редове за лога (с цена или предупреждение, че липсва).
+    """
+    sales = []
+    sales_details = []
+    total_sales_count = 0
+    prices = None
+
+    for p_id, p_data in current_inventory.items():
+        current_qty = p_data["qty"]
+        name = p_data["name"]
+
+        if p_id in previous_inventory:
+            prev_qty = previous_inventory[p_id]["qty"]
+            if current_qty < prev_qty:
+                sold = prev_qty - current_qty
+                total_sales_count += sold
+
+                # Цените на vendor-а се зареждат с една заявка при първата продажба
+                if prices is None:
+                    with metrics.stage("db_read"):
+                        prices = db.get_price_map(vendor_id)
+                price = prices.get(p_id)
+                if price is None:
+                    price_info = "⚠️ НЯМА ЦЕНА (оборота ще е 0 – добави цена и пусни maintenance.py reprice)"
+                else:
+                    price_info = f"цена: {price:.2f}"
+
+                sales_details.append(
+                    f"   - {name}: продадени {sold} бр. (Остават: {current_qty}) | {price_info}"
+                )
+                sales.append({
+                    "product_id": p_id,
+                    "product_name": name,
+                    "timestamp": timestamp,
+                    "quantity": sold,
+                })
+        else:
+            # нов продукт – просто го приемаме като нова наличност
+            pass
+
+    return sales, sales_details, total_sales_count
+
+
+def _record(writer, vendor_id: int, sales, current_inventory, previous_inventory, fingerprint):
+    """
+    Записва рън директно или през DbWriter-а и изчаква commit-а.
+    Грешката при запис (или изтичане на WRITE_TIMEOUT) се вдига нагоре.
+    """
+    if writer is None:
+        db.record_run(vendor_id, sales, current_inventory, previous_inventory, fingerprint)
+        return
+    future = writer.submit(vendor_id, sales, current_inventory, previous_inventory, fingerprint)
+    result = future.result(timeout=WRITE_TIMEOUT)
+    # писателят работи в своя нишка – броячите му се добавят тук, към metrics на вендора
+    metrics.add("sale_rows_written", result["sale_rows_written"])
+    metrics.add("stock_rows_written", result["stock_rows_written"])
+
+
 def run_for_vendor(
     vendor_id: int,
     state_file: str,      # вече НЕ се използва за логика, само за съвместимост със стария код
     log_file: str,
     vendor_name: str = "",
-    already_logged_in: bool = False
+    already_logged_in: bool = False,
+    writer=None
 ):
-    """Логика за един вендор – login (по избор), fetch, сравнение, лог."""
+    """
+    Логика за един вендор – login (по избор), fetch, сравнение, лог.
+    Ако е подаден writer (db_writer.DbWriter), записът в базата минава през
+    него (групиран с други вендори); иначе – директно с db.record_run.
+    Логът се пише едва след commit-а.
+    Връща True при успех и False, ако данните не са могли да се вземат;
+    грешка при записа в базата се вдига като изключение.
+    """
     print(f"\n=== Стартирам проверка за {vendor_name or vendor_id} ===")
 
     # Инициализираме базата (ако не е готова)
@@ -57,36 +173,50 @@ def run_for_vendor(
 
     # 1. login (само ако не сме вече логнати глобално)
     if not already_logged_in:
-        if not login():
+        if not ensure_logged_in():
             print("❌ Неуспешен логин, прекратяване.")
-            return
-
-    # 2. взимаме данните
-    data = get_products_for_vendor(vendor_id)
-
-    # ако сесията е изтекла – опитваме още веднъж
-    if data == "RETRY":
-        from bigarena_client import session
-        print("🔄 Опресняване на сесията и повторен опит...")
-        session.cookies.clear()
-        if not login():
-            print("❌ Неуспешен логин при повторен опит.")
-            return
-        data = get_products_for_vendor(vendor_id)
-
-    if data is None or data == "RETRY":
+            return False
+
+    # 2. + 3. взимаме данните страница по страница и ги обработваме веднага
+    result = fetch_inventory(vendor_id)
+    if result is None:
         print("❌ Неуспешно извличане на данни за този vendor.")
-        return
+        return False
 
-    # 3. Обработваме текущите наличности
-    current_inventory, current_total = process_inventory(data)
+    current_inventory, current_total = result
     timestamp = datetime.now().strftime("%d.%m.%Y/%H:%M")
 
-    # 4. Взимаме предишното състояние от базата (last_stock)
-    previous_inventory = db.get_last_inventory_for_vendor(vendor_id)
+    # 4. Ако отпечатъкът (product_id, qty) съвпада с последния – нищо не се е променило
+    with metrics.stage("diff"):
+        fingerprint = db.inventory_fingerprint(current_inventory)
+    with metrics.stage("db_read"):
+        if writer is not None:
+            # предишният рън на този vendor може още да е в опашката
+            if not writer.wait_for_vendor(vendor_id, WRITE_TIMEOUT):
+                raise TimeoutError(f"DbWriter не записа предишния рън за {WRITE_TIMEOUT:.0f} сек.")
+        previous_fingerprint = db.get_inventory_fingerprint(vendor_id)
+
+    if fingerprint == previous_fingerprint:
+        metrics.add("unchanged")
+        msg = (
+            f"{timestamp} - [{vendor_name or vendor_id}] Без промяна. "
+            f"Обща наличност: {current_total}"
+        )
+        print(msg)
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(msg + "\n")
+        return True
+
+    # 5. Взимаме предишното състояние от базата (last_stock)
+    with metrics.stage("db_read"):
+        previous_inventory = db.get_last_inventory_for_vendor(vendor_id)
 
     # Ако няма нищо в last_stock за този vendor → приемаме, че е първи рън
     if not previous_inventory:
+        # Записваме текущото състояние в last_stock (цял snapshot)
+        with metrics.stage("db_write"):
+            _record(writer, vendor_id, [], current_inventory, None, fingerprint)
+
         msg = (
             f"{timestamp} - ПЪРВОНАЧАЛЕН ЗАПИС [{vendor_name or vendor_id}]. "
             f"Обща наличност: {current_total} бр. "
@@ -95,47 +225,39 @@ def run_for_vendor(
         print(msg)
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(msg + "\n" + "-" * 50 + "\n")
+        return True
 
-        # Записваме текущото състояние в last_stock
-        db.replace_inventory_for_vendor(vendor_id, current_inventory)
-        return
-
-    # 5. Има предишно състояние – сравняваме
-    sales_details = []
-    total_sales_count = 0
-
-    for p_id, p_data in current_inventory.items():
-        current_qty = p_data["qty"]
-        name = p_data["name"]
-
-        if p_id in previous_inventory:
-            prev_qty = previous_inventory[p_id]["qty"]
-            if current_qty < prev_qty:
-                sold = prev_qty - current_qty
-                total_sales_count += sold
-
-                # Взимаме цена от базата (ако има)
-                price = db.get_price(vendor_id, p_id)
-                if price is None:
-                    price_info = "⚠️ НЯМА ЦЕНА (оборота ще е 0, добави цена в product_prices)"
-                else:
-                    price_info = f"цена: {price:.2f}"
+    removed = sum(1 for p_id in previous_inventory if p_id not in current_inventory)
+    if (
+        len(previous_inventory) >= STOCK_GUARD_MIN_PRODUCTS
+        and removed > STOCK_MAX_REMOVED_RATIO * len(previous_inventory)
+    ):
+        print(
+            f"⚠️ Липсват {removed} от {len(previous_inventory)} продукта спрямо предишния snapshot – "
+            f"тегля каталога още веднъж за потвърждение."
+        )
+        metrics.add("shrink_refetches")
+        retry = fetch_inventory(vendor_id)
+        with metrics.stage("diff"):
+            confirmed = retry is not None and db.inventory_fingerprint(retry[0]) == fingerprint
+        if not confirmed:
+            print(
+                "❌ Повторното извличане не потвърди по-малкия каталог – "
+                f"вероятно непълни данни, нищо не записвам (STOCK_MAX_REMOVED_RATIO={STOCK_MAX_REMOVED_RATIO})."
+            )
+            return False
+        print("Повторното извличане върна същия каталог – приемам изтеглените продукти.")
 
-                sales_details.append(
-                    f"   - {name}: продадени {sold} бр. (Остават: {current_qty}) | {price_info}"
-                )
+    # 6. Има предишно състояние – сравняваме и събираме продажбите
+    with metrics.stage("diff"):
+        sales, sales_details, total_sales_count = diff_inventory(
+            vendor_id, previous_inventory, current_inventory, timestamp
+        )
+    metrics.add("sales", total_sales_count)
 
-                # Записваме продажбата в таблица sales (цената се взима вътре)
-                db.insert_sale(
-                    vendor_id=vendor_id,
-                    product_id=p_id,
-                    product_name=name,
-                    timestamp=timestamp,
-                    quantity=sold
-                )
-        else:
-            # нов продукт – просто го приемаме като нова наличност
-            pass
+    # 7. Записваме продажбите и само промените в last_stock с една транзакция
+    with metrics.stage("db_write"):
+        _record(writer, vendor_id, sales, current_inventory, previous_inventory, fingerprint)
 
     header = (
         f"{timestamp} - [{vendor_name or vendor_id}] Обща наличност: {current_total} ; "
@@ -156,5 +278,28 @@ def run_for_vendor(
     with open(log_file, "a", encoding="utf-8") as f:
         f.write(final_log + "\n")
 
-    # 6. Обновяваме състоянието в last_stock за следващия рън
-    db.replace_inventory_for_vendor(vendor_id, current_inventory)
+    return True
+
+
+def run_vendor(v, writer=None):
+    """
+    Пуска run_for_vendor за един вендор от VENDORS, ползвайки вече логнатата сесия
+    (общо за run_all.py и daemon.py).
+    Връща RunMetrics с резултата (ok/error) и метриките по етапи.
+    """
+    with metrics.collect(v["name"], v["vendor_id"]) as m:
+        try:
+            m.ok = run_for_vendor(
+                vendor_id=v["vendor_id"],
+                state_file=v["state_file"],
+                log_file=v["log_file"],
+                vendor_name=v["name"],
+                already_logged_in=True,  # <-- КАЗВАМЕ, ЧЕ СМЕ ВЕЧЕ ЛОГНАТИ
+                writer=writer,
+            )
+            if not m.ok:
+                m.error = "неуспешно извличане/логин или непълни данни"
+        except Exception as e:
+            m.ok = False
+            m.error = f"{type(e).__name__}: {e}"
+    return m
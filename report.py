@@ -1,7 +1,64 @@
+"""
+Отчети за оборота.
+
+Без аргументи – интерактивно: оборот за един vendor и една дата.
+С аргументи – партиден отчет за много вендори и период с една групирана
+заявка върху daily_product_revenue; редовете се четат и записват на
+парчета (CSV или Parquet), така че паметта не зависи от периода:
+
+    python report.py --from 2025-11-01 --to 2025-11-30
+    python report.py --from 2025-11-01 --to 2025-11-30 --vendors 192,419 --format parquet --out nov
+    python report.py --from 2025-11-01 --to 2025-11-30 --per period
+
+Записват се два файла: <out>_products.<ext> (по продукт) и
+<out>_vendors.<ext> (общо по vendor). С --per day всеки ред има sale_date,
+с --per period – period_from/period_to (границите на периода).
+"""
+import argparse
+import csv
+import os
+import sys
+
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 
 import db
+from vendors_config import VENDORS
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - зависи от средата
+    pyarrow = None
+
+# Редове на парче при четене от базата
+CHUNK_SIZE = int(os.getenv("REPORT_CHUNK", "50000"))
+
+# Колоните на двата файла и типовете им (за Parquet схемата)
+PRODUCT_COLUMNS = {
+    "vendor_id": "int64", "vendor_name": "string", "sale_date": "string", "product_id": "string",
+    "product_name": "string", "quantity": "int64", "revenue": "float64",
+}
+VENDOR_COLUMNS = {
+    "vendor_id": "int64", "vendor_name": "string", "sale_date": "string",
+    "quantity": "int64", "revenue": "float64", "products": "int64",
+}
+
+
+def _date_columns(per: str):
+    return ["sale_date"] if per == "day" else ["period_from", "period_to"]
+
+
+def _columns_for(columns: dict, per: str) -> dict:
+    """Колоните на файла за per: при 'period' sale_date се заменя с period_from/period_to."""
+    result = {}
+    for name, col_type in columns.items():
+        if name == "sale_date":
+            for date_col in _date_columns(per):
+                result[date_col] = col_type
+        else:
+            result[name] = col_type
+    return result
 
 
 def get_daily_revenue(vendor_id: int, date_str: str):
@@ -12,76 +69,168 @@ def get_daily_revenue(vendor_id: int, date_str: str):
     """
     engine = db.get_sqlalchemy_engine()
 
-    # Общо по ден
-    query_total = text(
-        """
-        SELECT SUM(revenue) AS total_revenue
-        FROM sales
-        WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2)) = :date_str;
-        """
-    )
-    total_df = pd.read_sql_query(
-        query_total,
-        engine,
-        params={"vendor_id": vendor_id, "date_str": date_str},
-    )
-    total_revenue = (
-        float(total_df["total_revenue"].iloc[0])
-        if not total_df.empty and total_df["total_revenue"].iloc[0] is not None
-        else 0.0
-    )
-
-    # По продукти
-    query_products = text(
+    # Една заявка по rollup-а; общият оборот е сумата по продукти
+    query = text(
         """
         SELECT
             product_name,
             SUM(quantity) AS quantity,
             SUM(revenue) AS revenue
-        FROM sales
+        FROM daily_product_revenue
         WHERE vendor_id = :vendor_id
-          AND (substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2) || '-' || substr(timestamp, 1, 2)) = :date_str
+          AND sale_date = :date_str
         GROUP BY product_name
         ORDER BY revenue DESC;
         """
     )
-    products_df = pd.read_sql_query(
-        query_products,
-        engine,
-        params={"vendor_id": vendor_id, "date_str": date_str},
-    )
+    with engine.connect() as conn:
+        rows = conn.execute(query, {"vendor_id": vendor_id, "date_str": date_str}).all()
+
+    products = [
+        {"product_name": name, "quantity": int(quantity or 0), "revenue": float(revenue or 0.0)}
+        for name, quantity, revenue in rows
+    ]
+    total_revenue = sum(p["revenue"] for p in products)
+    return total_revenue, products
+
 
-    products = []
-    if not products_df.empty:
-        for _, row in products_df.iterrows():
-            products.append(
-                {
-                    "product_name": row["product_name"],
-                    "quantity": int(row["quantity"]),
-                    "revenue": float(row["revenue"]),
-                }
+# === ПАРТИДЕН ОТЧЕТ ===
+
+def _product_query(per: str):
+    """
+    per='day' – ред за (vendor, ден, продукт); per='period' – за (vendor, продукт)
+    за целия период, без колона с дата (границите се добавят в generate_report).
+    """
+    date_col = "sale_date," if per == "day" else ""
+    group_by = "vendor_id, sale_date, product_id" if per == "day" else "vendor_id, product_id"
+    order_by = "vendor_id, sale_date, revenue DESC" if per == "day" else "vendor_id, revenue DESC"
+    return text(
+        f"""
+        SELECT
+            vendor_id,
+            {date_col}
+            product_id,
+            MAX(product_name) AS product_name,
+            SUM(quantity) AS quantity,
+            SUM(revenue) AS revenue
+        FROM daily_product_revenue
+        WHERE vendor_id IN :vendor_ids
+          AND sale_date BETWEEN :date_from AND :date_to
+        GROUP BY {group_by}
+        ORDER BY {order_by};
+        """
+    ).bindparams(bindparam("vendor_ids", expanding=True))
+
+
+class _ChunkWriter:
+    """
+    Дописва DataFrame-и в един CSV или Parquet файл. columns е {колона: тип};
+    Parquet схемата идва от тях, а не от първото парче (колона само с NULL
+    в едно парче иначе става тип null и следващото парче не пасва).
+    """
+
+    def __init__(self, path: str, fmt: str, columns: dict):
+        self.path = path
+        self.fmt = fmt
+        self.columns = columns
+        self.rows = 0
+        self._parquet = None
+        self._header = True
+        self._schema = None
+        if fmt == "parquet":
+            self._schema = pyarrow.schema([(name, pyarrow.type_for_alias(t)) for name, t in columns.items()])
+
+    def write(self, df: pd.DataFrame):
+        df = df[list(self.columns)]
+        if self.fmt == "parquet":
+            table = pyarrow.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, self._schema)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._header else "a", header=self._header,
+                      index=False, encoding="utf-8", quoting=csv.QUOTE_MINIMAL)
+            self._header = False
+        self.rows += len(df)
+
+    def close(self):
+        if self.rows == 0:
+            # празен отчет – поне заглавен ред / схема
+            self.write(pd.DataFrame(columns=list(self.columns)))
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def generate_report(vendor_ids, date_from: str, date_to: str, out: str,
+                    fmt: str = "csv", per: str = "day", chunk_size: int = None) -> dict:
+    """
+    Записва <out>_products.<fmt> и <out>_vendors.<fmt> за вендорите и периода.
+    Продуктите се четат с една заявка на парчета (chunk_size реда); общите суми
+    по vendor се натрупват по пътя. Връща {"products": брой редове, "vendors": ...}.
+    """
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("За Parquet е нужен pyarrow (pip install pyarrow) – или ползвай --format csv.")
+    chunk_size = chunk_size or CHUNK_SIZE
+    names = {v["vendor_id"]: v["name"] for v in VENDORS}
+
+    date_cols = _date_columns(per)
+    products_out = _ChunkWriter(f"{out}_products.{fmt}", fmt, _columns_for(PRODUCT_COLUMNS, per))
+    totals = {}  # (vendor_id, *date_cols) → [quantity, revenue, products]
+
+    engine = db.get_sqlalchemy_engine()
+    params = {"vendor_ids": list(vendor_ids), "date_from": date_from, "date_to": date_to}
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql_query(_product_query(per), conn, params=params, chunksize=chunk_size):
+            if per == "day":
+                chunk["sale_date"] = chunk["sale_date"].astype(str).str[:10]
+            else:
+                chunk["period_from"] = date_from
+                chunk["period_to"] = date_to
+            chunk["revenue"] = chunk["revenue"].round(2)
+            chunk.insert(1, "vendor_name", chunk["vendor_id"].map(names))
+            products_out.write(chunk)
+
+            grouped = chunk.groupby(["vendor_id", *date_cols]).agg(
+                quantity=("quantity", "sum"), revenue=("revenue", "sum"), products=("product_id", "count")
             )
+            for key, row in zip(grouped.index, grouped.itertuples(index=False)):
+                t = totals.setdefault(key, [0, 0.0, 0])
+                t[0] += int(row.quantity)
+                t[1] += float(row.revenue)
+                t[2] += int(row.products)
+    products_out.close()
 
-    return total_revenue, products
+    vendor_columns = _columns_for(VENDOR_COLUMNS, per)
+    vendors_df = pd.DataFrame(
+        [(v, names.get(v), *dates, q, round(r, 2), n)
+         for (v, *dates), (q, r, n) in sorted(totals.items())],
+        columns=list(vendor_columns),
+    )
+    vendors_out = _ChunkWriter(f"{out}_vendors.{fmt}", fmt, vendor_columns)
+    if not vendors_df.empty:
+        vendors_out.write(vendors_df)
+    vendors_out.close()
 
+    return {"products": products_out.rows, "vendors": vendors_out.rows,
+            "paths": [products_out.path, vendors_out.path]}
 
-if __name__ == "__main__":
+
+def _parse_vendor_ids(value: str):
+    if not value or value == "all":
+        return [v["vendor_id"] for v in VENDORS]
+    return [int(x) for x in value.split(",") if x.strip()]
+
+
+def interactive():
     print("Избери vendor:")
-    print("1) WhiteMe (192)")
-    print("2) AirWays (419)")
-    print("3) Colzzy (426)")
-    choice = input("Въведи номер (1, 2 или 3): ").strip()
-
-    if choice == "1":
-        vendor_id = 192
-    elif choice == "2":
-        vendor_id = 419
-    elif choice == "3":
-        vendor_id = 426
-    else:
+    for n, v in enumerate(VENDORS, start=1):
+        print(f"{n}) {v['name']} ({v['vendor_id']})")
+    choice = input(f"Въведи номер (1-{len(VENDORS)}): ").strip()
+
+    if not choice.isdigit() or not 1 <= int(choice) <= len(VENDORS):
         print("Невалиден избор.")
-        exit(1)
+        sys.exit(1)
+    vendor_id = VENDORS[int(choice) - 1]["vendor_id"]
 
     date_str = input("Въведи дата (формат YYYY-MM-DD), напр. 2025-12-04: ").strip()
 
@@ -91,3 +240,31 @@ if __name__ == "__main__":
     print("По продукти:")
     for p in products:
         print(f"- {p['product_name']}: {p['quantity']} бр. | {p['revenue']:.2f} лв.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        interactive()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Партиден отчет за оборота по vendor и продукт.")
+    parser.add_argument("--from", dest="date_from", required=True, help="начална дата YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", required=True, help="крайна дата YYYY-MM-DD (включително)")
+    parser.add_argument("--vendors", default="all", help="vendor_id-та със запетая (по подразбиране всички от vendors_config)")
+    parser.add_argument("--per", choices=("day", "period"), default="day",
+                        help="ред по продукт за всеки ден или за целия период")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--out", default=None, help="префикс на файловете (по подразбиране report_<from>_<to>)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    out = args.out or f"report_{args.date_from}_{args.date_to}"
+    try:
+        result = generate_report(_parse_vendor_ids(args.vendors), args.date_from, args.date_to,
+                                 out, args.format, args.per, args.chunk_size)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"📊 Отчет {args.date_from} – {args.date_to}: {result['products']} реда по продукт, "
+          f"{result['vendors']} по vendor → {', '.join(result['paths'])}")
@@ -1,31 +1,208 @@
-import time
-from monitor import run_for_vendor
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import db
+import metrics
+from db_writer import DbWriter
+from monitor import run_vendor
 from vendors_config import VENDORS
-from bigarena_client import login  # <-- важно
+from bigarena_client import (  # <-- важно
+    configure_pool,
+    ensure_logged_in,
+    set_request_delay,
+    set_request_limiter,
+)
+
+# Колко вендора да се обработват паралелно (1 = последователно, както преди)
+DEFAULT_CONCURRENCY = int(os.getenv("MONITOR_CONCURRENCY", "4"))
+# Пауза между заявките към BigArena (сек.), вместо общия sleep между вендорите
+DEFAULT_REQUEST_DELAY = float(os.getenv("BIGARENA_REQUEST_DELAY", "1.0"))
+# Брой процеси (1 = всичко в този процес); всеки има своя сесия и връзка към базата
+DEFAULT_PROCESSES = int(os.getenv("MONITOR_PROCESSES", "1"))
+# Най-много толкова едновременни заявки към BigArena общо (0 = без лимит)
+DEFAULT_MAX_INFLIGHT = int(os.getenv("BIGARENA_MAX_INFLIGHT", "8"))
+
+
+def _shard(value: str):
+    """'i/n' → (i, n), 1 <= i <= n."""
+    try:
+        i, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("очаква се i/n, напр. 2/4")
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError("трябва 1 <= i <= n")
+    return i, n
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг на всички вендори от vendors_config.")
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"брой вендори, обработвани паралелно (по подразбиране {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=DEFAULT_REQUEST_DELAY,
+        help=f"минимална пауза между заявки към BigArena в сек. (по подразбиране {DEFAULT_REQUEST_DELAY})",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=DEFAULT_PROCESSES,
+        help=f"брой процеси, между които се делят вендорите (по подразбиране {DEFAULT_PROCESSES})",
+    )
+    parser.add_argument(
+        "--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+        help=f"най-много едновременни заявки към BigArena общо, 0 = без лимит (по подразбиране {DEFAULT_MAX_INFLIGHT})",
+    )
+    parser.add_argument(
+        "--shard", type=_shard, default=None, metavar="I/N",
+        help="обработва само I-тата от N части на списъка с вендори (напр. за отделни CI job-ове)",
+    )
+    return parser.parse_args(argv)
+
+
+def select_shard(vendors, shard):
+    """Вендорите на шард (i, n): всеки n-ти, започвайки от i-1."""
+    if not shard:
+        return list(vendors)
+    i, n = shard
+    return list(vendors)[i - 1::n]
+
+
+def run_vendors(vendors, concurrency: int):
+    """
+    Обработва вендорите с ограничен thread pool; записите в базата минават
+    през един DbWriter. Връща (succeeded, failed, records) – имена на
+    успешните, (име, причина) за неуспешните и метриките (dict) за всеки вендор.
+    """
+    results = []
+
+    with DbWriter() as writer:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [pool.submit(run_vendor, v, writer) for v in vendors]
+            for fut in as_completed(futures):
+                results.append(fut.result())
+
+    # Неуспешен запис в базата → вендорът е неуспешен, дори fetch-ът да е минал
+    write_errors = dict(writer.errors)
+    succeeded = []
+    failed = []
+    records = []
+    for m in results:
+        if m.ok and m.vendor_id in write_errors:
+            m.ok = False
+            m.error = f"запис в базата: {write_errors[m.vendor_id]}"
+        records.append(m.to_dict())
+        if m.ok:
+            succeeded.append(m.name)
+        else:
+            failed.append((m.name, m.error))
+
+    return succeeded, failed, records
+
+
+# === МНОГОПРОЦЕСЕН РЕЖИМ ===
+
+def _init_worker(delay: float, concurrency: int, semaphore):
+    """Инициализация на процес-работник: своя сесия (от кеша, ако има) и engine."""
+    set_request_delay(delay)
+    configure_pool(concurrency)
+    set_request_limiter(semaphore)
+    db.init_db()
+
+
+def _run_worker(vendors, concurrency: int):
+    """Обработва своята част от вендорите с thread pool; резултатът е като run_vendors."""
+    if not ensure_logged_in():
+        return [], [(v["name"], "неуспешен логин в процеса") for v in vendors], []
+    return run_vendors(vendors, concurrency)
+
+
+def run_vendors_in_processes(vendors, processes: int, concurrency: int,
+                             delay: float, semaphore):
+    """
+    Разделя вендорите между processes процеса (spawn – без споделени
+    сокети/връзки към базата) и събира резултатите им.
+    Паузата между заявки е на процес, затова се умножава по броя процеси.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    parts = [vendors[i::processes] for i in range(processes)]
+    parts = [p for p in parts if p]
+
+    succeeded, failed, records = [], [], []
+    with ProcessPoolExecutor(
+        max_workers=len(parts),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(delay * len(parts), concurrency, semaphore),
+    ) as pool:
+        futures = {pool.submit(_run_worker, part, concurrency): part for part in parts}
+        for fut in as_completed(futures):
+            try:
+                ok, bad, recs = fut.result()
+            except Exception as e:
+                ok, recs = [], []
+                bad = [(v["name"], f"процесът се провали: {type(e).__name__}: {e}") for v in futures[fut]]
+            succeeded += ok
+            failed += bad
+            records += recs
+
+    return succeeded, failed, records
+
 
 if __name__ == "__main__":
-    print("=== Стартирам общ мониторинг за всички вендори ===")
+    args = parse_args()
+    set_request_delay(args.delay)
+    configure_pool(args.concurrency)
+    vendors = select_shard(VENDORS, args.shard)
+    processes = max(1, min(args.processes, len(vendors)))
 
-    # 1. Логваме се веднъж
-    if not login():
+    semaphore = None
+    if args.max_inflight > 0:
+        if processes > 1:
+            semaphore = multiprocessing.get_context("spawn").BoundedSemaphore(args.max_inflight)
+        else:
+            semaphore = threading.BoundedSemaphore(args.max_inflight)
+    set_request_limiter(semaphore)
+
+    if args.shard:
+        print(f"=== Шард {args.shard[0]}/{args.shard[1]}: {len(vendors)} от {len(VENDORS)} вендора ===")
+    else:
+        print("=== Стартирам общ мониторинг за всички вендори ===")
+
+    # 1. Логваме се веднъж (или ползваме сесията от кеша на предишния рън)
+    with metrics.collect("(login)") as login_metrics:
+        login_metrics.ok = ensure_logged_in()
+    if not login_metrics.ok:
         print("❌ Глобален логин неуспешен. Прекратявам.")
-        exit(1)
-
-    # 2. Минаваме през всички вендори, ползвайки вече логнатата сесия
-    for v in VENDORS:
-        name = v["name"]
-        vendor_id = v["vendor_id"]
-        state_file = v["state_file"]
-        log_file = v["log_file"]
-
-        run_for_vendor(
-            vendor_id=vendor_id,
-            state_file=state_file,
-            log_file=log_file,
-            vendor_name=name,
-            already_logged_in=True  # <-- КАЗВАМЕ, ЧЕ СМЕ ВЕЧЕ ЛОГНАТИ
-        )
+        metrics.write_jsonl([login_metrics.to_dict()])
+        sys.exit(1)
 
-        time.sleep(5)
+    # Схемата се създава веднъж, преди нишките да тръгнат
+    db.init_db()
+
+    # 2. Минаваме през всички вендори паралелно, ползвайки вече логнатата сесия
+    #    (в процесите – сесията от кеша, който login-ът току-що записа)
+    if processes > 1:
+        succeeded, failed, records = run_vendors_in_processes(
+            vendors, processes, args.concurrency, args.delay, semaphore
+        )
+    else:
+        succeeded, failed, records = run_vendors(vendors, args.concurrency)
 
     print("=== Мониторингът приключи за всички вендори ===")
+
+    # 3. Метрики: JSON lines + (по избор) Prometheus textfile + таблица
+    records = [login_metrics.to_dict()] + records
+    metrics.write_jsonl(records)
+    metrics.write_prometheus(records)
+    metrics.print_summary(records)
+
+    print(f"✅ Успешни ({len(succeeded)}): {', '.join(succeeded) or '-'}")
+    if failed:
+        print(f"❌ Неуспешни ({len(failed)}):")
+        for name, reason in failed:
+            print(f"   - {name}: {reason}")
+        sys.exit(1)
@@ -0,0 +1,61 @@
+"""
+Регресия за import_prices: --default-price не бива да презаписва истински цени.
+
+    python -m pytest -q test_import_prices.py
+"""
+import json
+import os
+import tempfile
+
+# db чете DATABASE_URL при import-а – отделна временна SQLite база
+_workdir = tempfile.mkdtemp(prefix="bigarena-import-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["PRICE_CACHE_TTL"] = "0"
+
+import db  # noqa: E402
+import import_prices  # noqa: E402
+
+VENDOR_ID = 419
+
+
+def _write(name: str, content: str) -> str:
+    path = os.path.join(_workdir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def test_default_price_does_not_overwrite_existing_price():
+    db.init_db()
+    db.upsert_price(VENDOR_ID, "260636", "Airways лепенки за нос", 12.5)
+
+    state = _write("airways_inventory_state.json", json.dumps({
+        "260636": {"name": "Airways лепенки за нос", "qty": 5},
+        "266171": {"name": "Airways инхалатор за нос", "qty": 2},
+    }, ensure_ascii=False))
+
+    first = import_prices.import_prices(state, vendor_id=VENDOR_ID, default_price=0)
+    assert first == {"inserted": 1, "updated": 0, "unchanged": 1, "skipped": 0}
+    assert db.get_price_map(VENDOR_ID) == {"260636": 12.5, "266171": 0.0}
+
+    # повторен импорт – нищо не се променя
+    again = import_prices.import_prices(state, vendor_id=VENDOR_ID, default_price=0)
+    assert again == {"inserted": 0, "updated": 0, "unchanged": 2, "skipped": 0}
+    assert db.get_price_map(VENDOR_ID)["260636"] == 12.5
+
+    # истинска цена от файла все пак обновява
+    prices = _write("prices.csv", "product_id,unit_price\n266171,7.9\n")
+    real = import_prices.import_prices(prices, vendor_id=VENDOR_ID)
+    assert real == {"inserted": 0, "updated": 1, "unchanged": 0, "skipped": 0}
+    assert db.get_price_map(VENDOR_ID)["266171"] == 7.9
+
+
+def test_airways_price_list_is_insert_only():
+    db.init_db()
+    db.upsert_price(VENDOR_ID, "260636", "Airways лепенки за нос", 12.5)
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airways_prices.csv")
+    stats = import_prices.import_prices(path, default_price=0)
+    assert stats["updated"] == 0
+    assert db.get_price_map(VENDOR_ID)["260636"] == 12.5
+    assert db.get_price_map(VENDOR_ID)["266173"] == 0.0
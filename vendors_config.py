@@ -1,3 +1,6 @@
+import json
+import os
+
 VENDORS = [
     {
         "name": "WhiteMe",
@@ -19,3 +22,9 @@ VENDORS = [
     }
     # Тук по-късно ще добавяме още вендори по същия модел
 ]
+
+# По избор: списъкът може да дойде от JSON файл със същата структура
+# (напр. синтетичните вендори на bench_e2e.py)
+if os.getenv("VENDORS_FILE"):
+    with open(os.environ["VENDORS_FILE"], "r", encoding="utf-8") as f:
+        VENDORS = json.load(f)